@@ -0,0 +1,152 @@
+import asyncio
+import json
+import logging
+from typing import List, Optional
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+
+from app.config import settings
+from app.core.convert_to_image import get_file_type
+from app.core.client import run_on_llm_loop
+from app.core.pipeline import extract_document_async
+from app.core.router import model_router
+from app.core.usage import token_usage
+from app.model.api_model import BatchExtractionResponse, ExtractionResult
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+async def _read_upload(file: UploadFile) -> bytes:
+    """Read an uploaded file, enforcing the configured size limit"""
+    file_bytes = await file.read()
+    if len(file_bytes) > settings.MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"{file.filename} exceeds the {settings.MAX_UPLOAD_SIZE} byte upload limit",
+        )
+    if not file_bytes:
+        raise HTTPException(status_code=400, detail=f"{file.filename} is empty")
+    return file_bytes
+
+
+def _upload_file_type(file: UploadFile) -> str:
+    file_type = get_file_type(file.filename or "")
+    if not file_type:
+        raise HTTPException(status_code=415, detail=f"Unsupported file type: {file.filename}")
+    return file_type
+
+
+def _to_result(file: UploadFile, result) -> ExtractionResult:
+    if isinstance(result, dict):
+        return ExtractionResult(filename=file.filename, success=False, error=result.get("error"))
+    return ExtractionResult(filename=file.filename, success=True, data=result.model_dump())
+
+
+async def _extract_upload(file: UploadFile, model: str) -> ExtractionResult:
+    """Extract one upload on the shared LLM event loop; rasterization runs in threads"""
+    file_type = _upload_file_type(file)
+    file_bytes = await _read_upload(file)
+    result = await run_on_llm_loop(extract_document_async(file_bytes, file_type, model=model))
+    return _to_result(file, result)
+
+
+@router.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+async def _router_snapshot():
+    return model_router.snapshot()
+
+
+@router.get("/stats")
+async def stats():
+    """Token usage per model and prompt variant, and the auto router's live model statistics"""
+    # Router statistics are updated on the LLM event loop, so they are read there
+    models = await run_on_llm_loop(_router_snapshot())
+    return {"token_usage": token_usage.snapshot(), "models": models}
+
+
+@router.post("/extract", response_model=ExtractionResult)
+async def extract(file: UploadFile = File(...), model: Optional[str] = Form(None)):
+    """Extract structured data from a single PDF or image"""
+    result = await _extract_upload(file, model or settings.OPENROUTER_MODEL)
+    if not result.success:
+        raise HTTPException(status_code=422, detail=result.error)
+    return result
+
+
+@router.post("/extract/stream")
+async def extract_stream(file: UploadFile = File(...), model: Optional[str] = Form(None)):
+    """
+    Extract a single file and stream progress as newline-delimited JSON.
+
+    Emits {"type": "field"|"line_item", "page": n, ...} events as the model
+    produces them, then one {"type": "result", ...ExtractionResult} line.
+    """
+    file_type = _upload_file_type(file)
+    file_bytes = await _read_upload(file)
+    current_model = model or settings.OPENROUTER_MODEL
+
+    async def body():
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+
+        def on_event(event):
+            # Called on the LLM event loop thread
+            loop.call_soon_threadsafe(events.put_nowait, event)
+
+        async def run():
+            try:
+                result = await run_on_llm_loop(
+                    extract_document_async(file_bytes, file_type, model=current_model, on_event=on_event)
+                )
+                final = _to_result(file, result)
+            except HTTPException as e:
+                final = ExtractionResult(filename=file.filename, success=False, error=str(e.detail))
+            except Exception as e:
+                logger.error(f"Error extracting {file.filename}: {str(e)}")
+                final = ExtractionResult(filename=file.filename, success=False, error=str(e))
+            events.put_nowait({"type": "result", **final.model_dump()})
+            events.put_nowait(None)
+
+        task = asyncio.create_task(run())
+        try:
+            while (event := await events.get()) is not None:
+                yield json.dumps(event, default=str) + "\n"
+        finally:
+            task.cancel()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+@router.post("/extract/batch", response_model=BatchExtractionResponse)
+async def extract_batch(files: List[UploadFile] = File(...), model: Optional[str] = Form(None)):
+    """Extract structured data from several files concurrently"""
+    if len(files) > settings.API_MAX_BATCH_FILES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.API_MAX_BATCH_FILES} files can be extracted per batch",
+        )
+
+    current_model = model or settings.OPENROUTER_MODEL
+    semaphore = asyncio.Semaphore(settings.API_BATCH_CONCURRENCY)
+
+    async def run(file: UploadFile) -> ExtractionResult:
+        async with semaphore:
+            try:
+                return await _extract_upload(file, current_model)
+            except HTTPException as e:
+                return ExtractionResult(filename=file.filename, success=False, error=str(e.detail))
+            except Exception as e:
+                logger.error(f"Error extracting {file.filename}: {str(e)}")
+                return ExtractionResult(filename=file.filename, success=False, error=str(e))
+
+    results = await asyncio.gather(*(run(file) for file in files))
+    succeeded = sum(1 for result in results if result.success)
+    return BatchExtractionResponse(
+        results=results, succeeded=succeeded, failed=len(results) - succeeded
+    )
@@ -34,6 +34,8 @@ class Settings(BaseSettings):
     # API Configuration
     API_V1_STR: str = "/api/v1"
     PROJECT_NAME: str = "Invoice Processing API"
+    API_BATCH_CONCURRENCY: int = 4  # Documents extracted concurrently per batch request
+    API_MAX_BATCH_FILES: int = 50
 
     # OpenAI Configuration
     OPENAI_API_KEY: Optional[str] = None
@@ -56,13 +58,123 @@ class Settings(BaseSettings):
     OPENROUTER_MODEL_GEMINI: Optional[str] = "google/gemini-2.0-flash-001"
     OPENROUTER_MODEL_AMAZON: Optional[str] = "amazon/nova-lite-v1"
 
+    # Classifier stage (document type and size before extraction)
+    CLASSIFIER_ENABLED: bool = True
+    CLASSIFIER_MODEL: Optional[str] = None  # Small model asked when the heuristics are unsure, None = heuristics only
+    CLASSIFIER_SIMPLE_MODEL: Optional[str] = "google/gemini-2.0-flash-001"  # auto: first choice for simple documents
+    CLASSIFIER_COMPLEX_MODEL: Optional[str] = None  # auto: first choice for other documents, None = router's pick
+    CLASSIFIER_SIMPLE_MAX_LINE_ITEMS: int = 10  # Single pages with at most this many line items are simple
+    CLASSIFIER_RECEIPT_ASPECT_RATIO: float = 2.0  # Single page images this tall (height / width) count as receipts
+
+    # Model routing for the "auto" model (fallback chain over the models above)
+    MODEL_ROUTING_CHAIN: str = ""  # Comma separated, cheapest first; empty = the OPENROUTER_MODEL_* models
+    MODEL_ROUTING_POLICY: str = "chain"  # chain (first healthy model) or weighted (chain order vs live latency)
+    MODEL_ROUTING_LATENCY_WEIGHT: float = 0.5  # weighted policy: 0 = chain order only, 1 = fastest only
+    MODEL_ROUTING_MIN_QUALITY: float = 0.8  # Share of valid outputs below which a model is demoted
+    MODEL_ROUTING_MAX_ATTEMPTS: int = 3  # Models tried per document before giving up
+
+    # LLM client Configuration (shared connection pool and process-wide limiter)
+    LLM_TIMEOUT: float = 120.0  # Seconds per completion request (deadline per attempt)
+    LLM_MAX_CONCURRENCY: int = 8  # LLM requests in flight per process
+    LLM_REQUESTS_PER_SECOND: float = 0  # Token bucket rate per process, 0 = unlimited
+    LLM_BURST: int = 8  # Token bucket size
+    LLM_MAX_CONNECTIONS: int = 20
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    LLM_HTTP2: bool = True  # Used when the optional h2 package is installed
+    LLM_STRUCTURED_OUTPUTS: bool = True  # JSON schema response_format, prompt-only fallback per model
+    LLM_COMPACT_PROMPTS: bool = False  # Terse field lists instead of the full extraction prompt
+    LLM_PROMPT_CACHE_MODELS: str = "anthropic/,google/gemini"  # Model prefixes that get a cache_control breakpoint
+
+    # LLM retries, hedging and circuit breaking (per model)
+    LLM_MAX_RETRIES: int = 3  # Retries of timeouts, 408/409/429 and 5xx responses
+    LLM_BACKOFF_BASE: float = 1.0  # Seconds, doubled per retry with full jitter
+    LLM_BACKOFF_MAX: float = 30.0  # Upper bound, also for server Retry-After values
+    LLM_HEDGE_ENABLED: bool = True  # Send a second request when the first is slower than usual
+    LLM_HEDGE_PERCENTILE: float = 0.95  # Latency percentile that triggers the hedge
+    LLM_HEDGE_MIN_SAMPLES: int = 20  # Successful requests observed before hedging starts
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5  # Consecutive failures that open the circuit
+    LLM_CIRCUIT_RESET_TIMEOUT: float = 30.0  # Seconds before a trial request is let through
+
+    # PDF rasterization Configuration
+    PDF_RENDER_DPI: int = 150  # Used when adaptive DPI is disabled
+    PDF_RENDER_GRAYSCALE: bool = False
+    PDF_ADAPTIVE_DPI: bool = True  # Low DPI first, high DPI for fine print or failed validation
+    PDF_LOW_DPI: int = 100
+    PDF_HIGH_DPI: int = 200
+    PDF_FINE_PRINT_FONT_SIZE: float = 7.5  # Points
+    PDF_DENSE_WORDS_PER_SQ_INCH: float = 8.0
+
+    # PDF text layer fast path (born-digital PDFs skip full-resolution vision)
+    TEXT_LAYER_ENABLED: bool = True
+    TEXT_LAYER_MIN_CHARS: int = 100  # Non-whitespace characters for a page to count as text
+    TEXT_LAYER_MIN_ALNUM_RATIO: float = 0.5  # Guards against broken font encodings
+    TEXT_LAYER_THUMBNAIL: bool = False  # Also send a low-resolution page thumbnail
+    TEXT_LAYER_THUMBNAIL_DPI: int = 50
+    TEXT_LAYER_THUMBNAIL_LONG_EDGE: int = 768
+    TEXT_LAYER_MODEL: Optional[str] = None  # Cheaper text-only model for text pages without a thumbnail
+
+    # Rule-based header pre-extraction over the PDF text layer
+    PRE_EXTRACT_ENABLED: bool = True
+    PRE_EXTRACT_MIN_CONFIDENCE: float = 0.7  # Matches below this are ignored
+    PRE_EXTRACT_SKIP_LLM: bool = True  # Skip the LLM when every required field is found and no page has line items
+    PRE_EXTRACT_DAYFIRST: bool = True  # 03/04/2024 is 3 April
+
+    # Vendor template learning (coordinate-based extraction of repeat layouts)
+    TEMPLATE_ENABLED: bool = True
+    TEMPLATE_STORE_PATH: str = ".cache/templates.sqlite3"
+    TEMPLATE_MIN_RATING: int = 4  # Ratings at or above this teach a template
+    TEMPLATE_MATCH_THRESHOLD: float = 0.7  # Jaccard similarity of header fingerprints
+    TEMPLATE_BBOX_PADDING: float = 0.01  # Share of the page width added beside learned field boxes
+
+    # Image payload Configuration (applied before upload)
+    IMAGE_MAX_LONG_EDGE: int = 2048  # Pixels
+    IMAGE_GRAYSCALE: bool = False
+    IMAGE_FORMATS: str = "jpeg,webp"  # Comma separated, smallest encoding wins (png, jpeg, webp)
+    IMAGE_QUALITY: int = 85
+    IMAGE_MIN_QUALITY: int = 50  # Lowest quality used to fit IMAGE_MAX_BYTES
+    IMAGE_MAX_BYTES: int = 1024 * 1024  # 1MB per image, 0 = no byte budget
+    IMAGE_MAX_TOKENS: int = 0  # Estimated vision tokens per image, 0 = no token budget
+
+    # Extraction Configuration
+    EXTRACTION_MAX_WORKERS: int = 4  # Pages extracted concurrently per document
+    STREAMING_ENABLED: bool = True  # Stream completions in the Streamlit tab to show fields as they arrive
+
+    # Long line item tables, extracted in parallel row bands
+    LINE_ITEM_BANDING: bool = True
+    LINE_ITEM_BAND_ROWS: int = 40  # Table rows per band; text pages with more item rows are split
+    LINE_ITEM_BAND_OVERLAP: int = 2  # Rows repeated between neighbouring bands, removed when stitching
+    LINE_ITEM_MAX_WORKERS: int = 4  # Bands extracted concurrently per page
+
+    # Arithmetic consistency checks (line items, GST and totals) and targeted re-extraction
+    CONSISTENCY_CHECKS_ENABLED: bool = True
+    CONSISTENCY_TOLERANCE: float = 0.05  # Allowed difference between a sum and the printed amount
+    CONSISTENCY_REPAIR_ENABLED: bool = True  # Re-extract only the fields behind failed checks
+    CONSISTENCY_REPAIR_MODEL: Optional[str] = None  # Model for re-extraction, None = the model that extracted
+
+    # Extraction cache (keyed by file hash + model + prompt version)
+    EXTRACTION_CACHE_ENABLED: bool = True
+    EXTRACTION_CACHE_PATH: str = ".cache/extractions.sqlite3"
+    EXTRACTION_CACHE_MAX_BYTES: int = 100 * 1024 * 1024  # 100MB, LRU eviction
+
     # Database Configuration
     POSTGRES_CONNECTION_STRING: Optional[str] = None
+    POSTGRES_POOL_MIN: int = 1
+    POSTGRES_POOL_MAX: int = 20
+    POSTGRES_POOL_TIMEOUT: float = 30.0  # Seconds to wait for a free pooled connection
+    POSTGRES_HEALTH_TTL: float = 30.0  # Seconds is_connected() trusts the last observed health
+    POSTGRES_READ_RETRIES: int = 2  # Reconnect-and-retry attempts for idempotent reads
+    POSTGRES_RUN_MIGRATIONS: bool = True  # Apply pending schema migrations on first connect
+    POSTGRES_DUPLICATE_POLICY: str = "reject"  # reject or merge documents that are already saved
 
     # Upload Configuration
     UPLOAD_DIR: str = "uploads"
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
 
+    # Batch mode in the Extract Data tab
+    BATCH_MAX_WORKERS: int = 4  # Documents extracted concurrently
+    BATCH_MAX_FILES: int = 200  # Per batch, after ZIP archives are expanded
+    BATCH_MAX_UNZIPPED_SIZE: int = 500 * 1024 * 1024  # 500MB, total inflated from ZIP archives per batch
+
     class Config:
         env_file = ".env"
         case_sensitive = True
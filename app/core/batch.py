@@ -0,0 +1,163 @@
+import asyncio
+import io
+import logging
+import os
+import queue
+import zipfile
+import zlib
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Tuple
+
+from app.config import settings
+from app.core.cache import hash_file_bytes
+from app.core.client import get_current_model, run_sync
+from app.core.convert_to_image import get_file_type
+from app.core.pipeline import extract_document_async
+
+logger = logging.getLogger(__name__)
+
+# on_update(index, status, result): status is "processing" or "done"
+BatchUpdate = Callable[[int, str, Any], None]
+
+
+@dataclass
+class BatchDocument:
+    """One file of a batch, after ZIP archives are expanded"""
+
+    filename: str
+    file_bytes: bytes
+    file_type: str
+    file_hash: str
+
+
+def expand_uploads(files: List[Tuple[str, bytes]], max_files: Optional[int] = None) -> Tuple[List[BatchDocument], List[str]]:
+    """
+    Flatten uploaded (filename, bytes) pairs into extractable documents.
+
+    ZIP archives are expanded (one level). Unsupported, oversized and
+    repeated files are skipped; the second return value says which and why.
+    """
+    max_files = max_files or settings.BATCH_MAX_FILES
+    documents: List[BatchDocument] = []
+    skipped: List[str] = []
+    seen = {}
+
+    def add(filename: str, file_bytes: bytes):
+        file_type = get_file_type(filename)
+        if not file_type:
+            skipped.append(f"{filename}: unsupported file type")
+        elif not file_bytes:
+            skipped.append(f"{filename}: empty file")
+        elif len(file_bytes) > settings.MAX_UPLOAD_SIZE:
+            skipped.append(f"{filename}: exceeds the upload size limit")
+        elif len(documents) >= max_files:
+            skipped.append(f"{filename}: batch limit of {max_files} files reached")
+        else:
+            file_hash = hash_file_bytes(file_bytes)
+            if file_hash in seen:
+                skipped.append(f"{filename}: same file as {seen[file_hash]}")
+                return
+            seen[file_hash] = filename
+            documents.append(BatchDocument(filename, file_bytes, file_type, file_hash))
+
+    unzipped = 0
+    for filename, file_bytes in files:
+        if not filename.lower().endswith(".zip"):
+            add(filename, file_bytes)
+            continue
+        try:
+            with zipfile.ZipFile(io.BytesIO(file_bytes)) as archive:
+                for info in archive.infolist():
+                    name = os.path.basename(info.filename)
+                    if info.is_dir() or not name or name.startswith(".") or "__MACOSX" in info.filename:
+                        continue
+                    # Everything is checked before inflating, so a ZIP bomb costs nothing
+                    if len(documents) >= max_files:
+                        skipped.append(f"{filename}: batch limit of {max_files} files reached, remaining entries skipped")
+                        break
+                    if not get_file_type(name):
+                        skipped.append(f"{filename}/{info.filename}: unsupported file type")
+                        continue
+                    if info.file_size > settings.MAX_UPLOAD_SIZE:
+                        skipped.append(f"{filename}/{info.filename}: exceeds the upload size limit")
+                        continue
+                    if unzipped + info.file_size > settings.BATCH_MAX_UNZIPPED_SIZE:
+                        skipped.append(f"{filename}/{info.filename}: exceeds the batch size limit")
+                        continue
+                    # Never inflate more than the declared size, whatever the data holds
+                    try:
+                        with archive.open(info) as entry:
+                            entry_bytes = entry.read(info.file_size)
+                    except NotImplementedError:
+                        skipped.append(f"{filename}/{info.filename}: unsupported compression method")
+                        continue
+                    except RuntimeError:
+                        # zipfile's error for encrypted entries (NotImplementedError subclasses it)
+                        skipped.append(f"{filename}/{info.filename}: encrypted entry")
+                        continue
+                    except (zipfile.BadZipFile, zlib.error, EOFError, OSError) as e:
+                        skipped.append(f"{filename}/{info.filename}: could not be extracted ({str(e)})")
+                        continue
+                    unzipped += len(entry_bytes)
+                    add(name, entry_bytes)
+        except zipfile.BadZipFile:
+            skipped.append(f"{filename}: not a valid ZIP archive")
+
+    return documents, skipped
+
+
+async def extract_batch_async(
+    documents: List[BatchDocument],
+    model: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    on_update: Optional[BatchUpdate] = None,
+) -> List[Any]:
+    """
+    Extract every document with at most max_workers in flight.
+
+    Each worker runs the full pipeline (cache, text layer, rasterization in a
+    thread, LLM calls under the shared rate limiter). Returns one InvoiceInfo
+    or error dict per document, in input order. Must run on the LLM event
+    loop.
+    """
+    semaphore = asyncio.Semaphore(max_workers or settings.BATCH_MAX_WORKERS)
+
+    async def run(index: int, document: BatchDocument):
+        async with semaphore:
+            if on_update:
+                on_update(index, "processing", None)
+            try:
+                result = await extract_document_async(document.file_bytes, document.file_type, model=model)
+            except Exception as e:
+                logger.error(f"Error extracting {document.filename}: {str(e)}")
+                result = {"error": str(e)}
+            if on_update:
+                on_update(index, "done", result)
+            return result
+
+    return await asyncio.gather(*(run(index, document) for index, document in enumerate(documents)))
+
+
+def extract_batch(
+    documents: List[BatchDocument],
+    model: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    on_update: Optional[BatchUpdate] = None,
+) -> List[Any]:
+    """
+    Synchronous wrapper around extract_batch_async.
+
+    on_update is called in the calling thread, so it can safely update
+    Streamlit elements.
+    """
+    updates: queue.Queue = queue.Queue()
+    return run_sync(
+        extract_batch_async(
+            documents,
+            model=model or get_current_model(),
+            max_workers=max_workers,
+            on_update=(lambda *update: updates.put(update)) if on_update else None,
+        ),
+        events=updates,
+        on_event=(lambda update: on_update(*update)) if on_update else None,
+    )
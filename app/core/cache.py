@@ -0,0 +1,137 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from app.config import settings
+from app.core.prompt import ALL_PROMPTS
+from app.core.structured_output import EXTRACTION_SCHEMA
+
+logger = logging.getLogger(__name__)
+
+# Changing the prompts or output schema changes what the model returns, so
+# they are part of the key
+PROMPT_VERSION = hashlib.sha256(
+    "".join(ALL_PROMPTS + (json.dumps(EXTRACTION_SCHEMA, sort_keys=True), str(settings.LLM_COMPACT_PROMPTS))).encode("utf-8")
+).hexdigest()[:16]
+
+
+def hash_file_bytes(file_bytes: bytes) -> str:
+    """SHA-256 hex digest of the original file bytes"""
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+class ExtractionCache:
+    """
+    Persistent, content-addressed cache of validated extraction results.
+
+    Entries are keyed by the SHA-256 of the file bytes, the model id and the
+    prompt version, stored in SQLite and evicted least-recently-used once the
+    total stored size exceeds max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    @staticmethod
+    def make_key(file_hash: str, model: str, prompt_version: str = PROMPT_VERSION) -> str:
+        """Build the cache key for a file hash, model and prompt version"""
+        return f"{file_hash}:{model}:{prompt_version}"
+
+    @contextmanager
+    def _connect(self):
+        """Open a short-lived connection; SQLite handles cross-thread/process locking"""
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            yield connection
+            connection.commit()
+        finally:
+            connection.close()
+
+    def _ensure_schema(self):
+        if self._initialized:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+            CREATE TABLE IF NOT EXISTS extractions (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_accessed REAL NOT NULL
+            )
+            """)
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_extractions_last_accessed ON extractions (last_accessed)"
+            )
+        self._initialized = True
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result for key, or None on a miss"""
+        try:
+            with self._lock:
+                self._ensure_schema()
+                with self._connect() as connection:
+                    row = connection.execute(
+                        "SELECT value FROM extractions WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is None:
+                        return None
+                    connection.execute(
+                        "UPDATE extractions SET last_accessed = ? WHERE key = ?",
+                        (time.time(), key),
+                    )
+            return json.loads(row[0])
+        except Exception as e:
+            logger.error(f"Error reading extraction cache: {str(e)}")
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]):
+        """Store a result and evict least-recently-used entries over the size bound"""
+        try:
+            payload = json.dumps(value, default=str)
+            now = time.time()
+            with self._lock:
+                self._ensure_schema()
+                with self._connect() as connection:
+                    connection.execute(
+                        """
+                        INSERT OR REPLACE INTO extractions (key, value, size, created_at, last_accessed)
+                        VALUES (?, ?, ?, ?, ?)
+                        """,
+                        (key, payload, len(payload), now, now),
+                    )
+                    self._evict(connection)
+        except Exception as e:
+            logger.error(f"Error writing extraction cache: {str(e)}")
+
+    def _evict(self, connection: sqlite3.Connection):
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in connection.execute(
+            "SELECT key, size FROM extractions ORDER BY last_accessed ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            connection.execute("DELETE FROM extractions WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} extraction cache entries")
+
+
+# Create a singleton instance
+extraction_cache = ExtractionCache(settings.EXTRACTION_CACHE_PATH, settings.EXTRACTION_CACHE_MAX_BYTES)
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from app.config import settings
+from app.core.client import async_client, llm_limiter
+from app.core.image_encoding import encode_image
+from app.core.llm import load_llm_json
+from app.core.pre_extract import title_document_type
+from app.core.resilience import call_with_resilience
+from app.core.table_bands import estimate_line_items
+from app.core.usage import token_usage
+
+logger = logging.getLogger(__name__)
+
+# Long edge of the page thumbnail sent to the classifier model
+CLASSIFIER_IMAGE_LONG_EDGE = 512
+
+classifier_prompt = """
+Classify this document. Reply with only a JSON object:
+{"document_type": "invoice" | "statement", "line_items": number of line items}
+Receipts count as invoices.
+"""
+
+
+@dataclass
+class DocumentProfile:
+    """What the classifier stage knows about a document before extraction"""
+
+    document_type: Optional[str]  # "invoice", "statement" or None when unsure
+    page_count: int
+    line_items: Optional[int]  # Estimated number of line items, None when unknown
+    receipt_like: bool  # A single tall, narrow page image
+    source: str  # "heuristic" or the classifier model
+
+    @property
+    def is_simple(self) -> bool:
+        """A single page with few line items, which a small model handles well"""
+        if self.page_count != 1:
+            return False
+        if self.line_items is not None:
+            return self.line_items <= settings.CLASSIFIER_SIMPLE_MAX_LINE_ITEMS
+        return self.receipt_like
+
+    @property
+    def complexity(self) -> str:
+        return "simple" if self.is_simple else "complex"
+
+
+def classify_heuristic(images: list, page_texts=None, known_fields: Optional[Dict[str, Any]] = None) -> DocumentProfile:
+    """
+    Profile a document from what the pipeline already has: the rendered pages,
+    the PDF text layer and the pre-extracted fields. Costs no LLM call.
+    """
+    page_texts = page_texts or []
+    page_count = max(len(images or []), len(page_texts))
+
+    document_type = (known_fields or {}).get("document_type")
+    usable_texts = [page for page in page_texts if page is not None and page.is_usable]
+    if document_type is None and usable_texts:
+        document_type = title_document_type(usable_texts[0].text)
+
+    line_items = None
+    if usable_texts and len(usable_texts) == page_count:
+        line_items = sum(estimate_line_items(page.text) for page in usable_texts)
+
+    receipt_like = False
+    if page_count == 1 and images and images[0] is not None:
+        width, height = images[0].size
+        receipt_like = height >= width * settings.CLASSIFIER_RECEIPT_ASPECT_RATIO
+
+    return DocumentProfile(document_type, page_count, line_items, receipt_like, source="heuristic")
+
+
+async def _classify_with_model(image, model: str) -> Dict[str, Any]:
+    """Ask a cheap model for the document type and line item count of the first page"""
+    encoded = await asyncio.to_thread(encode_image, image, max_long_edge=CLASSIFIER_IMAGE_LONG_EDGE)
+    messages = [
+        {"role": "system", "content": classifier_prompt},
+        {"role": "user", "content": [{"type": "image_url", "image_url": {"url": encoded.data_url}}]},
+    ]
+    response = await call_with_resilience(
+        model,
+        lambda: async_client.chat.completions.create(
+            model=model, messages=messages, temperature=0, max_tokens=50
+        ),
+        limiter=llm_limiter,
+    )
+    token_usage.record(model, "classifier", getattr(response, "usage", None))
+    data = load_llm_json(response.choices[0].message.content)
+    return data if isinstance(data, dict) else {}
+
+
+async def classify_document(images: list, page_texts=None, known_fields: Optional[Dict[str, Any]] = None) -> DocumentProfile:
+    """
+    Profile a document before extraction.
+
+    Local heuristics come first; when they cannot tell the type or size of a
+    document and CLASSIFIER_MODEL is set, a thumbnail of the first page is
+    sent to that (small) model. Must run on the LLM event loop.
+    """
+    profile = classify_heuristic(images, page_texts, known_fields)
+    unsure = profile.document_type is None or (profile.line_items is None and not profile.receipt_like)
+    first_image = next((image for image in images or [] if image is not None), None)
+    if unsure and settings.CLASSIFIER_MODEL and first_image is not None:
+        try:
+            data = await _classify_with_model(first_image, settings.CLASSIFIER_MODEL)
+            if profile.document_type is None and data.get("document_type") in ("invoice", "statement"):
+                profile.document_type = data["document_type"]
+            line_items = data.get("line_items")
+            # bool is an int subclass; neither it nor a negative count is a line item count
+            if profile.line_items is None and type(line_items) is int and line_items >= 0:
+                profile.line_items = line_items
+            profile.source = settings.CLASSIFIER_MODEL
+        except Exception as e:
+            logger.warning(f"Classifier model failed, using heuristics only: {str(e)}")
+
+    logger.info(
+        f"Classified document: type={profile.document_type}, pages={profile.page_count}, "
+        f"line_items={profile.line_items}, {profile.complexity} (source: {profile.source})"
+    )
+    return profile
+
+
+def preferred_model(profile: DocumentProfile) -> Optional[str]:
+    """The model tier the auto router should try first for this document"""
+    if profile.is_simple:
+        return settings.CLASSIFIER_SIMPLE_MODEL
+    return settings.CLASSIFIER_COMPLEX_MODEL
@@ -1,19 +1,114 @@
-from openai import OpenAI   
-from app.config import settings
+import asyncio
 import logging
+import queue
+import threading
+from typing import Any, Callable, Coroutine, Optional
+
+import httpx
 import streamlit as st
+from openai import AsyncOpenAI
+
+from app.config import settings
+from app.core.rate_limit import AsyncRateLimiter
 
 logger = logging.getLogger(__name__)
 
-#client = OpenAI(
- #   api_key=settings.OPENAI_API_KEY, organization=settings.OPENAI_ORGANIZATION
-#)
 
-client = OpenAI(
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional h2 package (pip install httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+HTTP2_ENABLED = settings.LLM_HTTP2 and _http2_available()
+
+# Shared keep-alive connection pool for every LLM request in this process
+http_client = httpx.AsyncClient(
+    http2=HTTP2_ENABLED,
+    timeout=httpx.Timeout(settings.LLM_TIMEOUT, connect=10.0),
+    limits=httpx.Limits(
+        max_connections=settings.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+    ),
+)
+
+async_client = AsyncOpenAI(
     api_key=settings.OPENROUTER_API_KEY,
-    base_url=settings.OPENROUTER_API_BASE
+    base_url=settings.OPENROUTER_API_BASE,
+    http_client=http_client,
+    # Retries are handled per model in resilience.call_with_resilience
+    max_retries=0,
+)
+
+# Process-wide limit on in-flight LLM requests and request rate
+llm_limiter = AsyncRateLimiter(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    requests_per_second=settings.LLM_REQUESTS_PER_SECOND,
+    burst=settings.LLM_BURST,
+)
+logger.info(
+    f"LLM client: http2={HTTP2_ENABLED}, max_concurrency={settings.LLM_MAX_CONCURRENCY}, "
+    f"requests_per_second={settings.LLM_REQUESTS_PER_SECOND or 'unlimited'}"
 )
 
+# All LLM I/O runs on one background event loop so the connection pool and the
+# limiter are shared by Streamlit sessions, worker threads and API requests
+_llm_loop: Optional[asyncio.AbstractEventLoop] = None
+_llm_loop_lock = threading.Lock()
+
+
+def get_llm_loop() -> asyncio.AbstractEventLoop:
+    """Return the shared LLM event loop, starting its thread on first use"""
+    global _llm_loop
+    with _llm_loop_lock:
+        if _llm_loop is None:
+            _llm_loop = asyncio.new_event_loop()
+            threading.Thread(target=_llm_loop.run_forever, name="llm-event-loop", daemon=True).start()
+        return _llm_loop
+
+
+def run_sync(
+    coro: Coroutine[Any, Any, Any],
+    events: Optional[queue.Queue] = None,
+    on_event: Optional[Callable[[Any], None]] = None,
+):
+    """
+    Run a coroutine on the LLM event loop from synchronous code and wait for it.
+
+    Items the coroutine puts on events are handed to on_event in the calling
+    thread, so Streamlit callbacks never run on the loop thread.
+    """
+    loop = get_llm_loop()
+    if threading.current_thread().name == "llm-event-loop":
+        coro.close()
+        raise RuntimeError("run_sync cannot be called from the LLM event loop")
+
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    if events is None or on_event is None:
+        return future.result()
+
+    while True:
+        try:
+            on_event(events.get(timeout=0.1))
+        except queue.Empty:
+            if future.done():
+                break
+    while not events.empty():
+        on_event(events.get_nowait())
+    return future.result()
+
+
+async def run_on_llm_loop(coro: Coroutine[Any, Any, Any]):
+    """Await a coroutine on the LLM event loop from another event loop (e.g. FastAPI)"""
+    loop = get_llm_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
 # Get the model from session state if available, otherwise use default from settings
 def get_current_model():
     if st.session_state and hasattr(st, 'session_state') and 'selected_model' in st.session_state:
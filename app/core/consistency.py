@@ -0,0 +1,127 @@
+import logging
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import List, Optional, Set, Tuple
+
+from app.config import settings
+from app.model.extracted_model import InvoiceInfo
+
+logger = logging.getLogger(__name__)
+
+# Unit prices are printed to the cent, so quantity * unit_price may be off by
+# half a cent per unit, and every summed row adds up to half a cent of rounding
+ROUNDING = Decimal("0.005")
+
+# Fields that may be wrong when a check fails, i.e. what re-extraction targets
+LINE_ITEM_FIELDS = ("line_items",)
+TOTAL_FIELDS = ("total_amount", "tax_amount")
+
+
+@dataclass
+class CheckResult:
+    """Outcome of one arithmetic rule"""
+
+    name: str
+    passed: bool
+    detail: str = ""
+    fields: Tuple[str, ...] = ()  # Fields that may be wrong when the check fails
+
+
+@dataclass
+class ConsistencyReport:
+    """The rules that applied to an extraction and whether they held"""
+
+    checks: List[CheckResult] = field(default_factory=list)
+
+    @property
+    def failed(self) -> List[CheckResult]:
+        return [check for check in self.checks if not check.passed]
+
+    @property
+    def score(self) -> float:
+        """Share of the applicable rules that hold, 1.0 when none applied"""
+        if not self.checks:
+            return 1.0
+        return (len(self.checks) - len(self.failed)) / len(self.checks)
+
+    @property
+    def suspect_fields(self) -> Set[str]:
+        return {name for check in self.failed for name in check.fields}
+
+    def passed(self, name: str) -> Optional[bool]:
+        """Whether the named rule held, None when it did not apply"""
+        return next((check.passed for check in self.checks if check.name == name), None)
+
+    def summary(self) -> str:
+        if not self.checks:
+            return "no arithmetic to check"
+        failed = "; ".join(f"{check.name}: {check.detail}" for check in self.failed)
+        return f"score {self.score:.2f}" + (f" ({failed})" if failed else "")
+
+
+def _close(value: Decimal, expected: Decimal, tolerance: Decimal) -> bool:
+    return abs(value - expected) <= tolerance
+
+
+def check_line_item_arithmetic(info: InvoiceInfo, tolerance: Decimal) -> Optional[CheckResult]:
+    """quantity * unit_price matches total_price, with or without the row's GST"""
+    rows = [
+        (index, item)
+        for index, item in enumerate(info.line_items or [])
+        if item.quantity is not None and item.unit_price is not None
+    ]
+    if not rows:
+        return None
+    wrong = []
+    for index, item in rows:
+        expected = item.quantity * item.unit_price
+        row_tolerance = tolerance + abs(item.quantity) * ROUNDING
+        candidates = [expected] + ([expected + item.gst] if item.gst else [])
+        if not any(_close(item.total_price, candidate, row_tolerance) for candidate in candidates):
+            wrong.append(str(index + 1))
+    detail = f"rows {', '.join(wrong)} do not equal quantity x unit price" if wrong else ""
+    return CheckResult("line_item_arithmetic", not wrong, detail, LINE_ITEM_FIELDS)
+
+
+def check_line_items_total(info: InvoiceInfo, tolerance: Decimal) -> Optional[CheckResult]:
+    """
+    The line items add up to the document total.
+
+    Item prices may include or exclude tax, so the sum may equal the total,
+    the total less tax, or the total once the rows' GST is added.
+    """
+    items = info.line_items or []
+    if not items:
+        return None
+    item_sum = sum(item.total_price for item in items)
+    gst_sum = sum(item.gst or 0 for item in items)
+    tax = info.tax_amount or 0
+    tolerance += len(items) * ROUNDING
+    expected = [info.total_amount, info.total_amount - tax]
+    passed = _close(item_sum, expected[0], tolerance) or _close(item_sum, expected[1], tolerance)
+    passed = passed or (gst_sum and _close(item_sum + gst_sum, info.total_amount, tolerance))
+    detail = "" if passed else f"line items sum to {item_sum}, total is {info.total_amount} (tax {tax})"
+    return CheckResult("line_items_total", bool(passed), detail, LINE_ITEM_FIELDS + TOTAL_FIELDS)
+
+
+def check_gst_total(info: InvoiceInfo, tolerance: Decimal) -> Optional[CheckResult]:
+    """The rows' GST adds up to the tax amount"""
+    gst = [item.gst for item in info.line_items or [] if item.gst is not None]
+    if not gst or info.tax_amount is None:
+        return None
+    gst_sum = sum(gst)
+    passed = _close(gst_sum, info.tax_amount, tolerance + len(gst) * ROUNDING)
+    detail = "" if passed else f"line item GST sums to {gst_sum}, tax amount is {info.tax_amount}"
+    return CheckResult("gst_total", passed, detail, LINE_ITEM_FIELDS + ("tax_amount",))
+
+
+CHECKS = (check_line_item_arithmetic, check_line_items_total, check_gst_total)
+
+
+def check_consistency(info: InvoiceInfo) -> ConsistencyReport:
+    """Run every arithmetic rule that applies to an extraction"""
+    tolerance = Decimal(str(settings.CONSISTENCY_TOLERANCE))
+    report = ConsistencyReport([result for check in CHECKS if (result := check(info, tolerance)) is not None])
+    for check in report.failed:
+        logger.info(f"Consistency check {check.name} failed: {check.detail}")
+    return report
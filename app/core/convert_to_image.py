@@ -4,17 +4,82 @@ import fitz  # PyMuPDF
 from PIL import Image
 from fastapi import HTTPException
 
+from app.config import settings
+
 logger = logging.getLogger(__name__)
 
-def process_file_to_images(file_bytes, file_type):
-    """Convert uploaded file (PDF or image) to a list of PIL Images"""
+# Allowed file types
+ALLOWED_FILE_TYPES = {
+    "pdf": ["pdf"],
+    "image": ["png", "jpg", "jpeg", "webp"]
+}
+
+def get_file_type(filename):
+    """Return "pdf" or "image" for a filename, or None if the extension is unsupported"""
+    file_extension = filename.split('.')[-1].lower()
+    return next(
+        (ftype for ftype, extensions in ALLOWED_FILE_TYPES.items()
+         if file_extension in extensions),
+        None
+    )
+
+def process_file_to_images(file_bytes, file_type, **render_options):
+    """Convert uploaded file (PDF or image) to a list of PIL Images
+
+    render_options (dpi, grayscale, clip, adaptive) are passed to pdf_to_image.
+    """
     if file_type == "pdf":
-        return pdf_to_image(file_bytes)
+        return pdf_to_image(file_bytes, **render_options)
     else:
         return [image_to_pil(file_bytes)]
 
-def pdf_to_image(pdf_bytes):
-    """Convert PDF bytes to a list of PIL Images"""
+def is_fine_print_page(page):
+    """Whether a page's text layer suggests small print that needs a higher DPI
+
+    Looks at the smallest common font size and the number of words per square
+    inch. Pages without a text layer (scans) return False; those are re-rendered
+    only when validation fails.
+    """
+    font_sizes = sorted(
+        span["size"]
+        for block in page.get_text("dict")["blocks"]
+        for line in block.get("lines", [])
+        for span in line["spans"]
+        if span["text"].strip()
+    )
+    if not font_sizes:
+        return False
+
+    # 10th percentile ignores the odd footnote but catches small-print tables
+    small_font = font_sizes[len(font_sizes) // 10]
+    area_sq_inch = max(page.rect.width * page.rect.height / (72 * 72), 1)
+    words_per_sq_inch = len(page.get_text("words")) / area_sq_inch
+    return (
+        small_font < settings.PDF_FINE_PRINT_FONT_SIZE
+        or words_per_sq_inch > settings.PDF_DENSE_WORDS_PER_SQ_INCH
+    )
+
+def render_page(page, dpi, grayscale=False, clip=None):
+    """Render a PyMuPDF page to a PIL Image at the given DPI"""
+    pix = page.get_pixmap(
+        dpi=dpi,
+        colorspace=fitz.csGRAY if grayscale else fitz.csRGB,
+        clip=fitz.Rect(clip) if clip is not None else None,
+        alpha=False,
+    )
+    return Image.frombytes("L" if grayscale else "RGB", [pix.width, pix.height], pix.samples)
+
+def pdf_to_image(pdf_bytes, dpi=None, grayscale=None, clip=None, adaptive=None, pages=None):
+    """Convert PDF bytes to a list of PIL Images
+
+    dpi: render resolution; when set it overrides adaptive mode
+    grayscale: render in gray instead of RGB
+    clip: (x0, y0, x1, y1) region in PDF points to render on every page
+    adaptive: render at PDF_LOW_DPI and use PDF_HIGH_DPI only for fine print
+    pages: 0-based page indexes to render; other pages are returned as None
+    """
+    grayscale = settings.PDF_RENDER_GRAYSCALE if grayscale is None else grayscale
+    adaptive = settings.PDF_ADAPTIVE_DPI if adaptive is None else adaptive
     images = []
     try:
         pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
@@ -22,10 +87,18 @@ def pdf_to_image(pdf_bytes):
             raise ValueError("PDF document is empty")
             
         for page_num in range(len(pdf_document)):
+            if pages is not None and page_num not in pages:
+                images.append(None)
+                continue
             page = pdf_document.load_page(page_num)
-            pix = page.get_pixmap()
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            images.append(img)
+            if dpi:
+                page_dpi = dpi
+            elif adaptive:
+                page_dpi = settings.PDF_HIGH_DPI if is_fine_print_page(page) else settings.PDF_LOW_DPI
+            else:
+                page_dpi = settings.PDF_RENDER_DPI
+            logger.info(f"Rendering page {page_num + 1} at {page_dpi} DPI")
+            images.append(render_page(page, page_dpi, grayscale=grayscale, clip=clip))
         return images
     except fitz.FileDataError as e:
         logger.error("Invalid PDF file: %s", str(e))
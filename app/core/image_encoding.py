@@ -0,0 +1,128 @@
+import base64
+import logging
+import math
+from dataclasses import dataclass
+from io import BytesIO
+from typing import List, Optional
+
+from PIL import Image, features
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+# Scale factor applied per step when an image is still over budget
+DOWNSCALE_STEP = 0.8
+
+
+@dataclass
+class EncodedImage:
+    """An image encoded for upload, with the numbers we report per request"""
+
+    data: bytes
+    format: str
+    width: int
+    height: int
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    @property
+    def mime_type(self) -> str:
+        return MIME_TYPES[self.format]
+
+    @property
+    def estimated_tokens(self) -> int:
+        return estimate_image_tokens(self.width, self.height)
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode('utf-8')}"
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """
+    Rough vision token estimate (512px tiles at 170 tokens plus a base cost).
+
+    Providers differ, so this is only used to keep payloads under a budget.
+    """
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def _available_formats(formats: List[str]) -> List[str]:
+    available = []
+    for fmt in formats:
+        fmt = fmt.strip().lower().replace("jpg", "jpeg")
+        if fmt not in MIME_TYPES:
+            logger.warning(f"Ignoring unsupported image format: {fmt}")
+        elif fmt == "webp" and not features.check("webp"):
+            logger.warning("Pillow was built without WebP support, skipping webp")
+        else:
+            available.append(fmt)
+    return available or ["png"]
+
+
+def _resize(image: Image.Image, long_edge: int) -> Image.Image:
+    width, height = image.size
+    if max(width, height) <= long_edge:
+        return image
+    scale = long_edge / max(width, height)
+    return image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+
+
+def _encode(image: Image.Image, fmt: str, quality: int) -> EncodedImage:
+    buffered = BytesIO()
+    if fmt == "png":
+        image.save(buffered, format="PNG", optimize=True)
+    elif fmt == "jpeg":
+        image.save(buffered, format="JPEG", quality=quality, optimize=True)
+    else:
+        image.save(buffered, format="WEBP", quality=quality, method=4)
+    return EncodedImage(buffered.getvalue(), fmt, image.width, image.height)
+
+
+def encode_image(
+    image: Image.Image,
+    max_long_edge: Optional[int] = None,
+    grayscale: Optional[bool] = None,
+    formats: Optional[List[str]] = None,
+    quality: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    max_tokens: Optional[int] = None,
+) -> EncodedImage:
+    """
+    Downscale, optionally grayscale and encode an image for upload.
+
+    Every configured format is tried and the smallest encoding wins. While the
+    result is over max_bytes the quality is lowered (down to IMAGE_MIN_QUALITY)
+    and then the image is downscaled further. max_tokens caps the estimated
+    vision tokens by downscaling before encoding. Unset arguments fall back to
+    the IMAGE_* settings.
+    """
+    max_long_edge = max_long_edge or settings.IMAGE_MAX_LONG_EDGE
+    grayscale = settings.IMAGE_GRAYSCALE if grayscale is None else grayscale
+    formats = _available_formats(formats or settings.IMAGE_FORMATS.split(","))
+    quality = quality or settings.IMAGE_QUALITY
+    max_bytes = settings.IMAGE_MAX_BYTES if max_bytes is None else max_bytes
+    max_tokens = settings.IMAGE_MAX_TOKENS if max_tokens is None else max_tokens
+
+    # JPEG/WebP have no alpha channel; grayscale shrinks scans considerably
+    image = image.convert("L" if grayscale else "RGB")
+    image = _resize(image, max_long_edge)
+    while max_tokens and estimate_image_tokens(*image.size) > max_tokens and min(image.size) > 64:
+        image = _resize(image, int(max(image.size) * DOWNSCALE_STEP))
+
+    while True:
+        current_quality = quality
+        while True:
+            best = min((_encode(image, fmt, current_quality) for fmt in formats), key=lambda e: e.size)
+            if not max_bytes or best.size <= max_bytes or current_quality <= settings.IMAGE_MIN_QUALITY:
+                break
+            current_quality = max(settings.IMAGE_MIN_QUALITY, current_quality - 10)
+
+        if not max_bytes or best.size <= max_bytes or min(image.size) <= 64:
+            return best
+        image = _resize(image, int(max(image.size) * DOWNSCALE_STEP))
@@ -1,83 +1,320 @@
-import base64
+import asyncio
 import json
 import logging
-from io import BytesIO
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
 
-from app.core.client import client, get_current_model
+import openai
+
+from app.core.client import async_client, get_current_model, llm_limiter, run_sync
 from app.config import settings
-from app.core.prompt import extract_prompt
+from app.core.image_encoding import encode_image
+from app.core.prompt import build_prompt
+from app.core.resilience import call_with_resilience
+from app.core.router import resolve_model
+from app.core.streaming import IncrementalJSONParser, MalformedStreamError
+from app.core.structured_output import (
+    EXTRA_BODY,
+    LINE_ITEMS_RESPONSE_FORMAT,
+    RESPONSE_FORMAT,
+    is_unsupported_error,
+    mark_unsupported,
+    supports_structured_output,
+)
+from app.core.table_bands import BandPlan, plan_bands, stitch_bands
+from app.core.usage import token_usage
 from app.model.extracted_model import InvoiceInfo
 
 logger = logging.getLogger(__name__)
 
 
-def encode_image_to_base64(image):
-    buffered = BytesIO()
-    image.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+def build_extraction_messages(
+    image_url: Optional[str] = None,
+    text: Optional[str] = None,
+    known_fields: Optional[Dict[str, Any]] = None,
+    prompt: Optional[str] = None,
+    cache_prefix: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Build the chat messages for extracting a single page.
+
+    image_url is a data URL of the page (or of a thumbnail when text is given);
+    text is the page's PDF text layer, sent instead of a full-resolution image;
+    known_fields are values already found by the pre-extractor. prompt (from
+    prompt.build_prompt, the generic one by default) is the system message:
+    everything that is the same for every page comes first, so providers can
+    reuse it from their prompt cache, and cache_prefix marks it explicitly
+    for providers that need a cache_control breakpoint.
+    """
+    if prompt is None:
+        prompt, _ = build_prompt()
+    system_content: Any = prompt
+    if cache_prefix:
+        system_content = [{"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}}]
+
+    content: List[Dict[str, Any]] = []
+    if known_fields:
+        content.append({
+            "type": "text",
+            "text": "These fields were already read from the document; copy them unchanged and "
+                    f"extract the remaining fields: {json.dumps(known_fields, default=str)}",
+        })
+    if text is not None:
+        content.append({
+            "type": "text",
+            "text": f"The document's text layer (reading order, layout preserved):\n```\n{text}\n```",
+        })
+    if image_url is not None:
+        content.append({
+            "type": "image_url",
+            "image_url": {
+                "url": image_url
+            },
+        })
+    return [
+        {
+            "role": "system",
+            "content": system_content,
+        },
+        {
+            "role": "user",
+            "content": content,
+        }
+    ]
+
+
+def read_completion(response, model: str = "unknown", variant: str = "any-full") -> Optional[str]:
+    """Log a chat completion response, record its token usage and return its message content"""
+    # Log the full response for debugging
+    logger.info(f"OpenRouter raw response: {response}")
+    logger.info(f"Response type: {type(response)}")
+
+    if response is None:
+        logger.error("OpenRouter API returned None")
+        return None
+
+    if not hasattr(response, 'choices') or not response.choices:
+        logger.error(f"OpenRouter API response missing choices: {response}")
+        return None
+
+    # Log the message content
+    message_content = response.choices[0].message.content
+    logger.info(f"Message content: {message_content}")
+    logger.info(f"Message content type: {type(message_content)}")
+
+    # OpenRouter might not include usage information
+    token_usage.record(model, variant, getattr(response, 'usage', None))
+
+    return message_content
+
+
+async def _encode_page(image, text: Optional[str] = None) -> Optional[str]:
+    """Encode the page image (off the event loop) as a data URL"""
+    if text is not None:
+        logger.info(f"Text payload: {len(text)} characters")
+    if image is None:
+        return None
+    # Image encoding is CPU bound, keep it off the event loop
+    max_long_edge = settings.TEXT_LAYER_THUMBNAIL_LONG_EDGE if text is not None else None
+    encoded = await asyncio.to_thread(encode_image, image, max_long_edge=max_long_edge)
+    logger.info(
+        f"Image payload: {encoded.format} {encoded.width}x{encoded.height}, "
+        f"{encoded.size} bytes, ~{encoded.estimated_tokens} vision tokens"
+    )
+    return encoded.data_url
+
+
+def uses_cache_control(model: str) -> bool:
+    """Whether the model's provider needs an explicit cache_control breakpoint"""
+    prefixes = [prefix.strip() for prefix in settings.LLM_PROMPT_CACHE_MODELS.split(",") if prefix.strip()]
+    return any(model.startswith(prefix) for prefix in prefixes)
+
+
+async def _create_completion(
+    model: str,
+    image_url: Optional[str],
+    text: Optional[str],
+    known_fields: Optional[Dict[str, Any]],
+    document_type: Optional[str] = None,
+    stream: bool = False,
+    limiter=None,
+    hedge: bool = True,
+    part: str = "document",
+):
+    """
+    Send the extraction request for one page; returns the response (or
+    stream) and the name of the prompt variant used.
+
+    The output is constrained with a JSON schema response_format when the
+    model supports it; a model that rejects it is remembered and the request
+    is sent again with the schema spelled out in the prompt. When the
+    document type is known (from the classifier or known_fields), the prompt
+    for that type alone is used. part selects a header-only or table band
+    request (see prompt.build_prompt).
+    """
+    structured = supports_structured_output(model)
+    prompt, variant = build_prompt(
+        document_type=document_type or (known_fields or {}).get("document_type"),
+        structured=structured,
+        compact=settings.LLM_COMPACT_PROMPTS,
+        part=part,
+    )
+    messages = build_extraction_messages(
+        image_url=image_url,
+        text=text,
+        known_fields=known_fields,
+        prompt=prompt,
+        cache_prefix=uses_cache_control(model),
+    )
+    options: Dict[str, Any] = {}
+    if structured:
+        response_format = LINE_ITEMS_RESPONSE_FORMAT if part == "line_items" else RESPONSE_FORMAT
+        options = {"response_format": response_format, "extra_body": EXTRA_BODY}
+    if stream:
+        # The last chunk then carries the token usage
+        options["stream_options"] = {"include_usage": True}
+    try:
+        response = await call_with_resilience(
+            model,
+            lambda: async_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.75,
+                max_tokens=4096,
+                top_p=1,
+                frequency_penalty=0,
+                presence_penalty=0,
+                stream=stream,
+                **options,
+            ),
+            limiter=limiter,
+            hedge=hedge,
+        )
+        return response, variant
+    except (openai.BadRequestError, openai.NotFoundError) as e:
+        if not structured or not is_unsupported_error(e):
+            raise
+        mark_unsupported(model, e)
+        return await _create_completion(
+            model,
+            image_url,
+            text,
+            known_fields,
+            document_type,
+            stream=stream,
+            limiter=limiter,
+            hedge=hedge,
+            part=part,
+        )
+
 
+async def extract_info_async(
+    image,
+    model: Optional[str] = None,
+    text: Optional[str] = None,
+    known_fields: Optional[Dict[str, Any]] = None,
+    document_type: Optional[str] = None,
+    part: str = "document",
+):
+    """
+    Extract a single page with the async client.
 
-def extract_info(image):
+    Sends the page image, or the page's text layer (plus image, if given, as a
+    low-resolution thumbnail). Must run on the LLM event loop (see
+    client.run_sync / run_on_llm_loop); the request waits for a slot in the
+    process-wide llm_limiter. Transient failures are retried and slow
+    requests hedged (see resilience.call_with_resilience).
+    """
     try:
-        # Get the current model from session state or settings
-        current_model = get_current_model()
+        current_model = resolve_model(model)
         logger.info(f"Using model for extraction: {current_model}")
-        
-        base64_image = encode_image_to_base64(image)
-        response = client.chat.completions.create(
-            model=current_model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant that extracts information from documents. Always respond with valid JSON that matches the required schema. Include all required fields and format dates as YYYY-MM-DD."
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": extract_prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}"
-                            },
-                        },
-                    ],
-                }
-            ],
-            temperature=0.75,
-            max_tokens=4096,
-            top_p=1,
-            frequency_penalty=0,
-            presence_penalty=0,
+
+        image_url = await _encode_page(image, text=text)
+        response, variant = await _create_completion(
+            current_model, image_url, text, known_fields, document_type, limiter=llm_limiter, part=part
         )
+        return read_completion(response, model=current_model, variant=variant)
+    except Exception as e:
+        logger.error(f"Error in extract_info: {str(e)}")
+        return None
 
-        # Log the full response for debugging
-        logger.info(f"OpenRouter raw response: {response}")
-        logger.info(f"Response type: {type(response)}")
-        
-        if response is None:
-            logger.error("OpenRouter API returned None")
-            return None
-
-        if not hasattr(response, 'choices') or not response.choices:
-            logger.error(f"OpenRouter API response missing choices: {response}")
-            return None
-
-        # Log the message content
-        message_content = response.choices[0].message.content
-        logger.info(f"Message content: {message_content}")
-        logger.info(f"Message content type: {type(message_content)}")
-
-        # OpenRouter might not include usage information
-        if hasattr(response, 'usage') and response.usage:
-            logger.info(f"Token usage: prompt_tokens={getattr(response.usage, 'prompt_tokens', 'N/A')}, completion_tokens={getattr(response.usage, 'completion_tokens', 'N/A')}, total_tokens={getattr(response.usage, 'total_tokens', 'N/A')}")
-        
+
+async def stream_extract_info_async(
+    image,
+    on_event: Callable[[Dict[str, Any]], None],
+    model: Optional[str] = None,
+    text: Optional[str] = None,
+    known_fields: Optional[Dict[str, Any]] = None,
+    document_type: Optional[str] = None,
+    part: str = "document",
+):
+    """
+    Like extract_info_async, but streams the completion.
+
+    Header fields and validated line items are passed to on_event as soon as
+    they are complete (see streaming.IncrementalJSONParser). The stream is
+    closed early, and None returned, when the output stops being valid JSON.
+    """
+    try:
+        current_model = resolve_model(model)
+        logger.info(f"Streaming extraction with model: {current_model}")
+
+        image_url = await _encode_page(image, text=text)
+        parser = IncrementalJSONParser()
+        chunks = []
+        async with llm_limiter:
+            # Opening the stream is retried; a stream that fails midway is not,
+            # since its fields were already passed on. Not hedged either.
+            stream, variant = await _create_completion(
+                current_model, image_url, text, known_fields, document_type, stream=True, hedge=False, part=part
+            )
+            usage = None
+            try:
+                async for chunk in stream:
+                    usage = getattr(chunk, "usage", None) or usage
+                    # Once the object is complete only the usage chunk is awaited
+                    if parser.finished or not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    content = chunk.choices[0].delta.content
+                    chunks.append(content)
+                    for event in parser.feed(content):
+                        on_event(event)
+            except MalformedStreamError as e:
+                logger.error(f"Stopping malformed stream after {len(''.join(chunks))} characters: {str(e)}")
+                return None
+            finally:
+                await stream.close()
+
+        token_usage.record(current_model, variant, usage)
+        message_content = "".join(chunks)
+        logger.info(f"Streamed message content: {message_content}")
         return message_content
     except Exception as e:
-        logger.error(f"Error in extract_info: {str(e)}")
+        logger.error(f"Error in stream_extract_info_async: {str(e)}")
         return None
 
 
+def extract_info(image, model: Optional[str] = None, text: Optional[str] = None):
+    # Get the current model from session state or settings unless the caller
+    # already resolved it (the LLM event loop has no Streamlit session state)
+    return run_sync(extract_info_async(image, model=model or get_current_model(), text=text))
+
+
+def load_llm_json(output) -> Dict[str, Any]:
+    """Strip optional markdown fences from LLM output and decode the JSON object"""
+    if isinstance(output, (bytes, bytearray)):
+        output = output.decode("utf-8")
+    output = output.strip()
+
+    # Remove markdown code block if present
+    if output.startswith('```') and output.endswith('```'):
+        # Split by newline and remove first and last lines (```json and ```)
+        lines = output.split('\n')[1:-1]
+        output = '\n'.join(lines)
+
+    return json.loads(output)
+
+
 def parse_and_validate_llm_output(output):
     try:
         if output is None:
@@ -88,14 +325,8 @@ def parse_and_validate_llm_output(output):
             logger.error(f"Unexpected output type: {type(output)}")
             return {"error": f"Unexpected output type: {type(output)}"}
         
-        # Remove markdown code block if present
-        if output.startswith('```') and output.endswith('```'):
-            # Split by newline and remove first and last lines (```json and ```)
-            lines = output.split('\n')[1:-1]
-            output = '\n'.join(lines)
-        
         # Parse the JSON output from the LLM
-        data = json.loads(output)
+        data = load_llm_json(output)
         logger.info(f"Parsed JSON data: {data}")
         
         # Validate and parse using the Pydantic model
@@ -110,3 +341,281 @@ def parse_and_validate_llm_output(output):
         logger.error("Failed to validate LLM output: %s", str(e))
         logger.error(f"Data causing error: {output}")
         return {"error": "Invalid data structure in LLM output"}
+
+
+# Fields that normally sit on the last page of a multi-page document
+PAGE_TOTAL_FIELDS = ("total_amount", "tax_amount")
+
+
+def merge_page_results(pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge per-page extraction dicts (in page order) into a single document dict.
+
+    Header fields take the first non-null value, totals take the last non-null
+    value (totals are printed at the end of the document) and line items from
+    all pages are concatenated.
+    """
+    merged: Dict[str, Any] = {}
+
+    document_types = [page.get("document_type") for page in pages if page.get("document_type")]
+    if document_types:
+        merged["document_type"] = Counter(document_types).most_common(1)[0][0]
+
+    for page in pages:
+        for key, value in page.items():
+            if key in ("document_type", "line_items") or value in (None, ""):
+                continue
+            if key in PAGE_TOTAL_FIELDS:
+                merged[key] = value
+            elif key not in merged or merged[key] == "Unknown Customer":
+                merged[key] = value
+
+    line_items = [item for page in pages for item in (page.get("line_items") or [])]
+    merged["line_items"] = line_items or None
+    return merged
+
+
+async def _extract_rows_async(image, text, model: str) -> List[Dict[str, Any]]:
+    """Extract only the line items of a page or table band (an image and/or its text)"""
+    output = await extract_info_async(image, model=model, text=text, part="line_items")
+    if output is None:
+        raise ValueError("No output from LLM")
+    data = load_llm_json(output)
+    items = data.get("line_items") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise ValueError(f"Expected a list of line items, got {type(items).__name__}")
+    return items
+
+
+async def _extract_bands_async(bands: list, model: str) -> list:
+    """
+    Extract table bands (text rows or image strips) concurrently, at most
+    LINE_ITEM_MAX_WORKERS at once. Failed bands are returned as exceptions.
+    """
+    semaphore = asyncio.Semaphore(settings.LINE_ITEM_MAX_WORKERS)
+
+    async def run(band):
+        image, text = (None, band) if isinstance(band, str) else (band, None)
+        async with semaphore:
+            return await _extract_rows_async(image, text, model)
+
+    return await asyncio.gather(*(run(band) for band in bands), return_exceptions=True)
+
+
+async def _extract_banded_page_async(
+    plan: BandPlan, image, text, model: str, known_fields=None, on_event=None, document_type=None
+) -> Dict[str, Any]:
+    """
+    Extract a page with a long table: the header fields and every row band
+    concurrently, then stitch the bands back together.
+    """
+    logger.info(f"Splitting the line item table into {len(plan.bands)} bands")
+    header_text = plan.header_text if plan.header_text is not None else text
+    if on_event is not None:
+        header = stream_extract_info_async(
+            image, on_event, model=model, text=header_text, known_fields=known_fields,
+            document_type=document_type, part="header",
+        )
+    else:
+        header = extract_info_async(
+            image, model=model, text=header_text, known_fields=known_fields,
+            document_type=document_type, part="header",
+        )
+
+    output, bands = await asyncio.gather(header, _extract_bands_async(plan.bands, model), return_exceptions=True)
+    if isinstance(output, Exception):
+        raise output
+    if output is None:
+        raise ValueError("No output from LLM")
+    data = load_llm_json(output)
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+
+    for index, band in enumerate(bands):
+        if isinstance(band, Exception):
+            # The consistency check against the total flags the missing rows
+            logger.error(f"Failed to extract line item band {index + 1}: {str(band)}")
+    line_items = stitch_bands([band for band in bands if not isinstance(band, Exception)])
+    if on_event is not None:
+        for index, item in enumerate(line_items):
+            on_event({"type": "line_item", "index": index, "item": item})
+    data["line_items"] = line_items or None
+    return data
+
+
+async def _extract_page_async(
+    image, model: str, page_text=None, known_fields=None, on_event=None, document_type=None
+) -> Dict[str, Any]:
+    """
+    Extract a single page and return the decoded JSON dict (not yet validated).
+
+    Pages with a usable text layer are sent as text, with the image as a
+    thumbnail when TEXT_LAYER_THUMBNAIL is set, and use TEXT_LAYER_MODEL when
+    configured and no image is sent. Pages with a long line item table are
+    split into row bands (see table_bands). With on_event the completion is
+    streamed.
+    """
+    plan = await asyncio.to_thread(plan_bands, image, page_text)
+    if page_text is not None and page_text.is_usable:
+        thumbnail = image if settings.TEXT_LAYER_THUMBNAIL else None
+        model = model if thumbnail is not None else (settings.TEXT_LAYER_MODEL or model)
+        logger.info(f"Page {page_text.page_number + 1}: using text layer with {model}")
+        image, text = thumbnail, page_text.text
+    elif image is not None:
+        text = None
+    else:
+        raise ValueError("Page has neither a usable text layer nor an image")
+
+    if plan is not None:
+        return await _extract_banded_page_async(
+            plan, image, text, model, known_fields=known_fields, on_event=on_event, document_type=document_type
+        )
+
+    if on_event is not None:
+        output = await stream_extract_info_async(
+            image, on_event, model=model, text=text, known_fields=known_fields, document_type=document_type
+        )
+    else:
+        output = await extract_info_async(
+            image, model=model, text=text, known_fields=known_fields, document_type=document_type
+        )
+
+    if output is None:
+        raise ValueError("No output from LLM")
+    data = load_llm_json(output)
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+    return data
+
+
+async def extract_info_multipage_async(
+    images,
+    model: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    page_texts=None,
+    known_fields: Optional[Dict[str, Any]] = None,
+    on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+    document_type: Optional[str] = None,
+):
+    """
+    Extract every page of a document concurrently and merge the results.
+
+    images and page_texts (from text_layer.extract_text_layer) are aligned by
+    page; an entry may be None when that page only has the other input.
+    known_fields (from the pre-extractor) are sent as hints and take precedence
+    over the model's values when merging. With on_event every page is streamed
+    and its events are passed on with a "page" key (0-based). A known
+    document_type selects the prompt for that type. At
+    most max_workers pages of this document are in flight at once (on top of
+    the process-wide llm_limiter), so total wall time tracks the slowest page
+    rather than the sum of pages. Returns an InvoiceInfo on success or an
+    error dict, like parse_and_validate_llm_output.
+    """
+    page_count = max(len(images or []), len(page_texts or []))
+    if not page_count:
+        return {"error": "No pages to extract"}
+    images = list(images or []) + [None] * (page_count - len(images or []))
+    page_texts = list(page_texts or []) + [None] * (page_count - len(page_texts or []))
+
+    current_model = resolve_model(model)
+    max_workers = max(1, min(max_workers or settings.EXTRACTION_MAX_WORKERS, page_count))
+    logger.info(f"Extracting {page_count} page(s) with {current_model} using {max_workers} worker(s)")
+
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def run(page_number, image, page_text):
+        page_on_event = None
+        if on_event is not None:
+            page_on_event = lambda event: on_event({**event, "page": page_number})
+        async with semaphore:
+            return await _extract_page_async(
+                image,
+                current_model,
+                page_text=page_text,
+                known_fields=known_fields,
+                on_event=page_on_event,
+                document_type=document_type,
+            )
+
+    results = await asyncio.gather(
+        *(run(page_number, image, page_text) for page_number, (image, page_text) in enumerate(zip(images, page_texts))),
+        return_exceptions=True,
+    )
+
+    extracted_pages = []
+    for index, result in enumerate(results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to extract page {index + 1}: {str(result)}")
+        else:
+            extracted_pages.append(result)
+
+    if not extracted_pages:
+        return {"error": "No output from LLM"}
+    if len(extracted_pages) < page_count:
+        logger.warning(f"Merged {len(extracted_pages)} of {page_count} pages; some pages failed")
+
+    merged = merge_page_results(extracted_pages)
+    merged.update(known_fields or {})
+    try:
+        return InvoiceInfo(**merged)
+    except Exception as e:
+        logger.error("Failed to validate merged output: %s", str(e))
+        logger.error(f"Data causing error: {merged}")
+        return {"error": "Invalid data structure in LLM output"}
+
+
+async def extract_line_items_async(images, model: str, page_texts=None) -> List[Dict[str, Any]]:
+    """
+    Extract only the line items of a document, in page order, without the
+    header fields (long tables in row bands, as in a full extraction).
+
+    Pages run concurrently (at most EXTRACTION_MAX_WORKERS). Raises when a page
+    or band fails, since a partial table cannot be told from a complete one.
+    """
+    page_count = max(len(images or []), len(page_texts or []))
+    images = list(images or []) + [None] * (page_count - len(images or []))
+    page_texts = list(page_texts or []) + [None] * (page_count - len(page_texts or []))
+    current_model = resolve_model(model)
+    semaphore = asyncio.Semaphore(max(1, settings.EXTRACTION_MAX_WORKERS))
+
+    async def run(image, page_text):
+        text = page_text.text if page_text is not None and page_text.is_usable else None
+        if image is None and text is None:
+            raise ValueError("Page has neither a usable text layer nor an image")
+        plan = await asyncio.to_thread(plan_bands, image, page_text)
+        async with semaphore:
+            if plan is None:
+                return await _extract_rows_async(image, text, current_model)
+            bands = await _extract_bands_async(plan.bands, current_model)
+        for band in bands:
+            if isinstance(band, Exception):
+                raise band
+        return stitch_bands(bands)
+
+    pages = await asyncio.gather(*(run(image, page_text) for image, page_text in zip(images, page_texts)))
+    return [item for items in pages for item in items]
+
+
+async def extract_fields_async(
+    image, model: str, fields, page_text=None, document_type: Optional[str] = None
+) -> Dict[str, Any]:
+    """Re-read a few header fields from one page; returns only those fields"""
+    text = page_text.text if page_text is not None and page_text.is_usable else None
+    output = await extract_info_async(
+        image, model=resolve_model(model), text=text, document_type=document_type, part="header"
+    )
+    if output is None:
+        raise ValueError("No output from LLM")
+    data = load_llm_json(output)
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+    return {name: data.get(name) for name in fields}
+
+
+def extract_info_multipage(images, model: Optional[str] = None, max_workers: Optional[int] = None, page_texts=None):
+    """Synchronous wrapper around extract_info_multipage_async"""
+    return run_sync(
+        extract_info_multipage_async(
+            images, model=model or get_current_model(), max_workers=max_workers, page_texts=page_texts
+        )
+    )
@@ -0,0 +1,211 @@
+import logging
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for the advisory lock that serializes concurrent migrators
+MIGRATION_LOCK_ID = 741_852_963
+
+# (version, name, SQL). Append only: applied migrations are never edited,
+# schema changes go in a new version.
+MIGRATIONS: List[Tuple[int, str, str]] = [
+    (
+        1,
+        "create document and rating tables",
+        """
+        CREATE TABLE IF NOT EXISTS invoices (
+            id SERIAL PRIMARY KEY,
+            document_type TEXT NOT NULL,
+            invoice_number TEXT,
+            invoice_date DATE,
+            total_amount DECIMAL(10,2) NOT NULL,
+            vendor_name TEXT NOT NULL,
+            customer_name TEXT NOT NULL,
+            due_date DATE,
+            tax_amount DECIMAL(10,2),
+            PO_number TEXT,
+            reference TEXT,
+            line_items JSONB,
+            uploaded_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            filename TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS statements (
+            id SERIAL PRIMARY KEY,
+            document_type TEXT NOT NULL,
+            statement_date DATE,
+            total_amount DECIMAL(10,2) NOT NULL,
+            vendor_name TEXT NOT NULL,
+            customer_name TEXT NOT NULL,
+            reference TEXT,
+            statement_due_date DATE,
+            PO_number TEXT,
+            line_items JSONB,
+            uploaded_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            filename TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS ratings (
+            id SERIAL PRIMARY KEY,
+            filename TEXT NOT NULL,
+            document_type TEXT NOT NULL,
+            model TEXT NOT NULL,
+            rating INTEGER NOT NULL,
+            comment TEXT,
+            document_id INTEGER NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+    ),
+    (
+        2,
+        "index history and rating lookups",
+        """
+        CREATE INDEX IF NOT EXISTS invoices_uploaded_at_idx ON invoices (uploaded_at DESC);
+        CREATE INDEX IF NOT EXISTS statements_uploaded_at_idx ON statements (uploaded_at DESC);
+        CREATE INDEX IF NOT EXISTS invoices_vendor_invoice_number_idx ON invoices (vendor_name, invoice_number);
+        CREATE INDEX IF NOT EXISTS ratings_document_id_idx ON ratings (document_id, created_at DESC);
+        CREATE INDEX IF NOT EXISTS ratings_document_type_idx ON ratings (document_type, created_at DESC);
+        """,
+    ),
+    (
+        3,
+        "keyset pagination indexes for document history",
+        """
+        CREATE INDEX IF NOT EXISTS invoices_uploaded_at_id_idx ON invoices (uploaded_at DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS statements_uploaded_at_id_idx ON statements (uploaded_at DESC, id DESC);
+        DROP INDEX IF EXISTS invoices_uploaded_at_idx;
+        DROP INDEX IF EXISTS statements_uploaded_at_idx;
+        """,
+    ),
+    (
+        4,
+        "search indexes for dates, amounts and line item text",
+        """
+        CREATE INDEX IF NOT EXISTS invoices_invoice_date_idx ON invoices (invoice_date);
+        CREATE INDEX IF NOT EXISTS statements_statement_date_idx ON statements (statement_date);
+        CREATE INDEX IF NOT EXISTS invoices_total_amount_idx ON invoices (total_amount);
+        CREATE INDEX IF NOT EXISTS statements_total_amount_idx ON statements (total_amount);
+        CREATE INDEX IF NOT EXISTS invoices_line_items_search_idx ON invoices
+            USING GIN (to_tsvector('english', jsonb_path_query_array(line_items, '$[*].description')));
+        CREATE INDEX IF NOT EXISTS statements_line_items_search_idx ON statements
+            USING GIN (to_tsvector('english', jsonb_path_query_array(line_items, '$[*].description')));
+        """,
+    ),
+    (
+        5,
+        "trigram indexes for name and number search",
+        """
+        DO $$
+        BEGIN
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        EXCEPTION WHEN OTHERS THEN
+            -- Not installed or not permitted: searches still work, just unindexed
+            RAISE WARNING 'pg_trgm unavailable, skipping trigram indexes: %', SQLERRM;
+            RETURN;
+        END $$;
+
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+                CREATE INDEX IF NOT EXISTS invoices_vendor_name_trgm_idx ON invoices USING GIN (vendor_name gin_trgm_ops);
+                CREATE INDEX IF NOT EXISTS invoices_customer_name_trgm_idx ON invoices USING GIN (customer_name gin_trgm_ops);
+                CREATE INDEX IF NOT EXISTS invoices_invoice_number_trgm_idx ON invoices USING GIN (invoice_number gin_trgm_ops);
+                CREATE INDEX IF NOT EXISTS invoices_po_number_trgm_idx ON invoices USING GIN (PO_number gin_trgm_ops);
+                CREATE INDEX IF NOT EXISTS statements_vendor_name_trgm_idx ON statements USING GIN (vendor_name gin_trgm_ops);
+                CREATE INDEX IF NOT EXISTS statements_customer_name_trgm_idx ON statements USING GIN (customer_name gin_trgm_ops);
+                CREATE INDEX IF NOT EXISTS statements_reference_trgm_idx ON statements USING GIN (reference gin_trgm_ops);
+                CREATE INDEX IF NOT EXISTS statements_po_number_trgm_idx ON statements USING GIN (PO_number gin_trgm_ops);
+            END IF;
+        END $$;
+        """,
+    ),
+    (
+        6,
+        "duplicate detection by file hash and natural key",
+        """
+        ALTER TABLE invoices ADD COLUMN IF NOT EXISTS file_hash TEXT;
+        ALTER TABLE invoices ADD COLUMN IF NOT EXISTS duplicate_of INTEGER;
+        ALTER TABLE statements ADD COLUMN IF NOT EXISTS file_hash TEXT;
+        ALTER TABLE statements ADD COLUMN IF NOT EXISTS duplicate_of INTEGER;
+
+        -- Documents saved more than once before this migration are flagged
+        -- (not deleted); the earliest copy stays the canonical one
+        UPDATE invoices AS document SET duplicate_of = original.first_id
+        FROM (
+            SELECT id, MIN(id) OVER (PARTITION BY lower(vendor_name), invoice_number, total_amount) AS first_id
+            FROM invoices WHERE invoice_number IS NOT NULL
+        ) AS original
+        WHERE document.id = original.id AND original.first_id <> original.id;
+
+        UPDATE statements AS document SET duplicate_of = original.first_id
+        FROM (
+            SELECT id, MIN(id) OVER (PARTITION BY lower(vendor_name), reference, statement_date, total_amount) AS first_id
+            FROM statements WHERE reference IS NOT NULL AND statement_date IS NOT NULL
+        ) AS original
+        WHERE document.id = original.id AND original.first_id <> original.id;
+
+        CREATE UNIQUE INDEX IF NOT EXISTS invoices_file_hash_key ON invoices (file_hash)
+            WHERE duplicate_of IS NULL;
+        CREATE UNIQUE INDEX IF NOT EXISTS invoices_natural_key ON invoices (lower(vendor_name), invoice_number, total_amount)
+            WHERE duplicate_of IS NULL;
+        CREATE UNIQUE INDEX IF NOT EXISTS statements_file_hash_key ON statements (file_hash)
+            WHERE duplicate_of IS NULL;
+        CREATE UNIQUE INDEX IF NOT EXISTS statements_natural_key ON statements (lower(vendor_name), reference, statement_date, total_amount)
+            WHERE duplicate_of IS NULL;
+        """,
+    ),
+]
+
+
+def run_migrations(connection) -> int:
+    """
+    Apply pending migrations in order and return the schema version.
+
+    Each migration runs in its own transaction and is recorded in
+    schema_migrations, so a failing one keeps the versions before it and
+    stops the run. An
+    advisory lock makes concurrent processes (Streamlit and API workers
+    starting together) wait for each other instead of racing on the same DDL.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            )
+            """)
+            cursor.execute("SELECT version FROM schema_migrations")
+            applied = {row[0] for row in cursor.fetchall()}
+            connection.commit()
+
+            for version, name, sql in MIGRATIONS:
+                if version in applied:
+                    continue
+                logger.info(f"Applying database migration {version}: {name}")
+                try:
+                    cursor.execute(sql)
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name)
+                    )
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
+                applied.add(version)
+        finally:
+            # A lost connection releases the lock by itself
+            if not connection.closed:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+                connection.commit()
+    return max(applied, default=0)
+
+
+if __name__ == "__main__":
+    # Run the migrations without starting the app: python -m app.core.migrations
+    from app.core.supabase_client import postgres
+
+    print(postgres.migrate())
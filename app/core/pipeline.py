@@ -0,0 +1,319 @@
+import asyncio
+import io
+import logging
+import queue
+import time
+from typing import Any, Callable, Dict, Optional
+
+from app.config import settings
+from app.core.cache import ExtractionCache, extraction_cache, hash_file_bytes
+from app.core.classifier import classify_document, preferred_model
+from app.core.consistency import TOTAL_FIELDS, check_consistency
+from app.core.client import get_current_model, run_sync
+from app.core.convert_to_image import pdf_to_image, process_file_to_images
+from app.core.llm import extract_fields_async, extract_info_multipage_async, extract_line_items_async
+from app.core.pre_extract import confident_fields, missing_required_fields, pre_extract
+from app.core.router import AUTO_MODEL, model_router
+from app.core.table_bands import estimate_line_items
+from app.core.templates import template_store
+from app.core.text_layer import extract_text_layer
+from app.model.extracted_model import InvoiceInfo
+
+logger = logging.getLogger(__name__)
+
+
+def _may_have_line_items(page_texts) -> bool:
+    """
+    Whether a document may hold line items, which only the LLM extracts:
+    any page with priced lines in its text layer, or without a text layer
+    """
+    return any(page is None or not page.is_usable or estimate_line_items(page.text) for page in page_texts or [None])
+
+
+def render_for_extraction(file_bytes: bytes, file_type: str, page_texts=None):
+    """
+    Rasterize only what the LLM needs to see.
+
+    Pages with a usable text layer are skipped (or rendered as a small
+    thumbnail when TEXT_LAYER_THUMBNAIL is set); every other page is rendered
+    normally. The returned list is aligned with page_texts.
+    """
+    if file_type != "pdf" or not page_texts:
+        return process_file_to_images(io.BytesIO(file_bytes), file_type)
+
+    image_pages = [page.page_number for page in page_texts if not page.is_usable]
+    text_pages = [page.page_number for page in page_texts if page.is_usable]
+    images = pdf_to_image(file_bytes, pages=image_pages) if image_pages else [None] * len(page_texts)
+    if settings.TEXT_LAYER_THUMBNAIL and text_pages:
+        thumbnails = pdf_to_image(file_bytes, dpi=settings.TEXT_LAYER_THUMBNAIL_DPI, pages=text_pages)
+        images = [image or thumbnail for image, thumbnail in zip(images, thumbnails)]
+    return images
+
+
+def _better(result: InvoiceInfo, report, candidate: Dict[str, Any], label: str):
+    """The candidate (a document dict) and its report when it validates and scores better than result"""
+    try:
+        info = InvoiceInfo(**candidate)
+    except Exception as e:
+        logger.warning(f"Re-extracted {label} failed validation: {str(e)}")
+        return result, report
+    candidate_report = check_consistency(info)
+    # Fewer rules that apply (e.g. rows without quantities) is no evidence of a better read
+    if candidate_report.score > report.score and len(candidate_report.checks) >= len(report.checks):
+        logger.info(f"Re-extracted {label} improved consistency: {candidate_report.summary()}")
+        return info, candidate_report
+    logger.info(f"Re-extracted {label} did not improve consistency ({candidate_report.summary()}), keeping the original")
+    return result, report
+
+
+async def _repair_inconsistent(
+    result: InvoiceInfo,
+    model: str,
+    file_bytes: bytes,
+    file_type: str,
+    images: list,
+    page_texts,
+    known_fields: Dict[str, Any],
+    on_status: Optional[Callable[[str], None]] = None,
+    document_type: Optional[str] = None,
+) -> InvoiceInfo:
+    """
+    Check the arithmetic of an extraction and re-extract only what failed.
+
+    Line items that do not add up are re-read on their own (rows only, no
+    header fields); totals that still disagree with internally consistent rows
+    are re-read from the last page. Re-extraction uses high-DPI renders of PDFs
+    and CONSISTENCY_REPAIR_MODEL when set; a candidate replaces the result only
+    when it scores better.
+    """
+    report = check_consistency(result)
+    logger.info(f"Consistency of the extraction with {model}: {report.summary()}")
+    if not report.failed or not settings.CONSISTENCY_REPAIR_ENABLED:
+        return result
+
+    repair_model = settings.CONSISTENCY_REPAIR_MODEL or model
+    if on_status:
+        on_status(f"Amounts do not add up, re-checking with {repair_model}...")
+    try:
+        if file_type == "pdf":
+            images = await asyncio.to_thread(
+                process_file_to_images, io.BytesIO(file_bytes), file_type, dpi=settings.PDF_HIGH_DPI
+            )
+        if "line_items" in report.suspect_fields:
+            items = await extract_line_items_async(images, repair_model, page_texts)
+            result, report = _better(result, report, {**result.model_dump(), "line_items": items or None}, "line items")
+
+        # Rows that are right on their own but do not add up point at the totals
+        total_fields = [name for name in TOTAL_FIELDS if name in report.suspect_fields and name not in known_fields]
+        if total_fields and report.passed("line_item_arithmetic") is not False:
+            last_text = page_texts[-1] if page_texts else None
+            fields = await extract_fields_async(images[-1], repair_model, total_fields, last_text, document_type)
+            fields = {name: value for name, value in fields.items() if value is not None}
+            if fields:
+                result, report = _better(result, report, {**result.model_dump(), **fields}, "totals")
+    except Exception as e:
+        logger.warning(f"Re-extraction of inconsistent fields failed: {str(e)}")
+    return result
+
+
+async def _extract_with_model(
+    model: str,
+    file_bytes: bytes,
+    file_type: str,
+    images: list,
+    page_texts,
+    known_fields: Dict[str, Any],
+    on_status: Optional[Callable[[str], None]] = None,
+    on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+    document_type: Optional[str] = None,
+):
+    """Extract the rasterized pages with one model (the LLM part of the pipeline)"""
+    if on_status:
+        page_label = f"{len(images)} pages" if len(images) > 1 else "1 page"
+        on_status(f"Extracting data from {page_label} with {model}...")
+    result = await extract_info_multipage_async(
+        images,
+        model=model,
+        page_texts=page_texts,
+        known_fields=known_fields,
+        on_event=on_event,
+        document_type=document_type,
+    )
+
+    # Low-DPI renders and text layers keep the common case cheap; when the
+    # model's output does not validate, try once more with every page as a
+    # high-DPI image
+    if (
+        isinstance(result, dict)
+        and result.get("error") != "No output from LLM"
+        and file_type == "pdf"
+        and settings.PDF_ADAPTIVE_DPI
+    ):
+        logger.info(f"Validation failed ({result.get('error')}), re-rendering at {settings.PDF_HIGH_DPI} DPI")
+        if on_status:
+            on_status(f"Re-extracting at {settings.PDF_HIGH_DPI} DPI...")
+        images = await asyncio.to_thread(
+            process_file_to_images, io.BytesIO(file_bytes), file_type, dpi=settings.PDF_HIGH_DPI
+        )
+        result = await extract_info_multipage_async(
+            images, model=model, known_fields=known_fields, on_event=on_event, document_type=document_type
+        )
+
+    # Line items, tax and totals must add up; only what does not is re-extracted
+    if isinstance(result, InvoiceInfo) and settings.CONSISTENCY_CHECKS_ENABLED:
+        result = await _repair_inconsistent(
+            result, model, file_bytes, file_type, images, page_texts, known_fields, on_status, document_type
+        )
+    return result
+
+
+async def extract_document_async(
+    file_bytes: bytes,
+    file_type: str,
+    model: Optional[str] = None,
+    use_cache: bool = True,
+    images: Optional[list] = None,
+    on_status: Optional[Callable[[str], None]] = None,
+    on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+):
+    """
+    Run the full extraction pipeline for an uploaded file.
+
+    Checks the persistent extraction cache first (keyed by file content, model
+    and prompt version), otherwise rasterizes the file, extracts every page and
+    caches the validated result. Callers that already rasterized the file (for
+    a preview) can pass the pages as images. With on_event, completions are
+    streamed and fields/line items are reported as they arrive. Returns an
+    InvoiceInfo or an error dict. With the "auto" model the router picks the
+    model and falls back down its chain. Must run on the LLM event loop (see
+    client.run_on_llm_loop).
+    """
+    current_model = model or settings.OPENROUTER_MODEL
+    use_cache = use_cache and settings.EXTRACTION_CACHE_ENABLED
+    cache_key = ExtractionCache.make_key(hash_file_bytes(file_bytes), current_model)
+
+    if use_cache:
+        cached = await asyncio.to_thread(extraction_cache.get, cache_key)
+        if cached is not None:
+            logger.info(f"Extraction cache hit for {cache_key}")
+            return InvoiceInfo(**cached)
+
+    # Born-digital PDFs can be extracted from their text layer, which is far
+    # cheaper than vision; scanned pages fall back to images automatically
+    page_texts = None
+    if file_type == "pdf" and settings.TEXT_LAYER_ENABLED:
+        page_texts = await asyncio.to_thread(extract_text_layer, file_bytes)
+
+    # Rule-based pre-extraction and learned vendor templates (which win over the
+    # generic rules): known fields are passed to the LLM as hints, and the LLM
+    # is skipped when all required fields are found
+    known_fields = {}
+    if page_texts and settings.PRE_EXTRACT_ENABLED:
+        known_fields.update(confident_fields(await asyncio.to_thread(pre_extract, page_texts)))
+    if page_texts and settings.TEMPLATE_ENABLED:
+        known_fields.update(await asyncio.to_thread(template_store.match, page_texts))
+    if (
+        known_fields
+        and settings.PRE_EXTRACT_SKIP_LLM
+        and not missing_required_fields(known_fields)
+        and not _may_have_line_items(page_texts)
+    ):
+        try:
+            # Saved like LLM output, which uses "Unknown Customer" (customer_name is NOT NULL)
+            result = InvoiceInfo(**{"customer_name": "Unknown Customer", **known_fields})
+            logger.info("All required fields found without the LLM, skipping LLM")
+            if use_cache:
+                await asyncio.to_thread(extraction_cache.set, cache_key, result.model_dump())
+            return result
+        except Exception as e:
+            logger.warning(f"Pre-extracted fields failed validation, calling LLM: {str(e)}")
+
+    if images is None:
+        if on_status:
+            on_status(f"Converting {file_type.upper()} to image...")
+        images = await asyncio.to_thread(render_for_extraction, file_bytes, file_type, page_texts)
+    if not images:
+        return {"error": f"Failed to process {file_type.upper()} file"}
+
+    # Classify first (type and size of the document), so the extractor gets a
+    # prompt for that type and auto routing can send simple documents to a
+    # small model
+    document_type, preferred = None, None
+    if settings.CLASSIFIER_ENABLED:
+        profile = await classify_document(images, page_texts, known_fields)
+        document_type, preferred = profile.document_type, preferred_model(profile)
+
+    if current_model != AUTO_MODEL:
+        result = await _extract_with_model(
+            current_model, file_bytes, file_type, images, page_texts, known_fields, on_status, on_event, document_type
+        )
+    else:
+        # Route to the best model right now and fall back down the chain when
+        # a model fails or its output does not validate
+        for attempt, routed_model in enumerate(model_router.candidates(preferred=preferred)):
+            if attempt and on_status:
+                on_status(f"Falling back to {routed_model}...")
+            started = time.monotonic()
+            result = await _extract_with_model(
+                routed_model, file_bytes, file_type, images, page_texts, known_fields, on_status, on_event, document_type
+            )
+            error = isinstance(result, dict) and result.get("error") == "No output from LLM"
+            # Output whose amounts still do not add up counts against the model's quality
+            inconsistent = (
+                isinstance(result, InvoiceInfo)
+                and settings.CONSISTENCY_CHECKS_ENABLED
+                and bool(check_consistency(result).failed)
+            )
+            model_router.record(
+                routed_model,
+                None if error else (time.monotonic() - started) / len(images),
+                error=error,
+                validation_failed=(isinstance(result, dict) and not error) or inconsistent,
+            )
+            if isinstance(result, InvoiceInfo):
+                logger.info(f"Routed extraction succeeded with {routed_model}")
+                break
+            logger.warning(f"Routed extraction with {routed_model} failed: {result.get('error')}")
+
+    if use_cache and isinstance(result, InvoiceInfo):
+        await asyncio.to_thread(extraction_cache.set, cache_key, result.model_dump())
+    return result
+
+
+def extract_document(
+    file_bytes: bytes,
+    file_type: str,
+    model: Optional[str] = None,
+    use_cache: bool = True,
+    images: Optional[list] = None,
+    on_status: Optional[Callable[[str], None]] = None,
+    on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+):
+    """
+    Synchronous wrapper around extract_document_async.
+
+    on_status and on_event are called in the calling thread, so they can
+    safely update Streamlit elements.
+    """
+    events: queue.Queue = queue.Queue()
+
+    def dispatch(item):
+        kind, payload = item
+        if kind == "status":
+            on_status(payload)
+        else:
+            on_event(payload)
+
+    return run_sync(
+        extract_document_async(
+            file_bytes,
+            file_type,
+            model=model or get_current_model(),
+            use_cache=use_cache,
+            images=images,
+            on_status=(lambda label: events.put(("status", label))) if on_status else None,
+            on_event=(lambda event: events.put(("event", event))) if on_event else None,
+        ),
+        events=events,
+        on_event=dispatch,
+    )
@@ -0,0 +1,200 @@
+import logging
+import re
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Dict, List, Optional
+
+from dateutil import parser as date_parser
+
+from app.config import settings
+from app.core.text_layer import PageText
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FieldMatch:
+    """A header field found without the LLM"""
+
+    value: Any
+    confidence: float  # 0..1
+    source: str  # Name of the pre-extractor that found it
+    page_number: Optional[int] = None
+
+
+PreExtractor = Callable[[List[PageText]], Dict[str, FieldMatch]]
+
+# Pre-extractors run in registration order; the most confident match per field wins
+PRE_EXTRACTORS: List[PreExtractor] = []
+
+REQUIRED_FIELDS = {
+    "invoice": ("document_type", "invoice_number", "invoice_date", "total_amount", "vendor_name"),
+    "statement": ("document_type", "statement_date", "reference", "total_amount", "vendor_name", "customer_name"),
+}
+
+
+def register_pre_extractor(pre_extractor: PreExtractor) -> PreExtractor:
+    """Register a pre-extractor (usable as a decorator)"""
+    PRE_EXTRACTORS.append(pre_extractor)
+    return pre_extractor
+
+
+def parse_amount(value: str) -> Optional[Decimal]:
+    """Parse '1,234.50', '$1 234.50' or '(12.00)' into a Decimal"""
+    cleaned = re.sub(r"[^\d.\-()]", "", value)
+    negative = cleaned.startswith("(") and cleaned.endswith(")")
+    cleaned = cleaned.strip("()")
+    try:
+        amount = Decimal(cleaned).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        return None
+    return -amount if negative else amount
+
+
+def parse_date(value: str) -> Optional[str]:
+    """Parse a printed date into YYYY-MM-DD (day-first unless PRE_EXTRACT_DAYFIRST is off)"""
+    try:
+        return date_parser.parse(value, dayfirst=settings.PRE_EXTRACT_DAYFIRST, fuzzy=False).date().isoformat()
+    except (ValueError, OverflowError):
+        return None
+
+
+DATE = r"(\d{1,2}[/.\-]\d{1,2}[/.\-]\d{2,4}|\d{4}-\d{2}-\d{2}|\d{1,2}[ \t]+[A-Za-z]{3,9}\.?,?[ \t]+\d{4}|[A-Za-z]{3,9}\.?[ \t]+\d{1,2},?[ \t]+\d{4})"
+AMOUNT = r"(?:[A-Z]{3}[ \t]*)?\$?[ \t]*(\(?-?\d{1,3}(?:[, ]\d{3})*(?:\.\d{2})\)?|\(?-?\d+\.\d{2}\)?)"
+# Values follow their label on the same line
+SEP = r"[ \t]*[:#.]?[ \t]*"
+# Document numbers contain a digit, which rules out headings and words ("Invoice #   Amount")
+NUMBER = r"((?=[A-Z\-/]*\d)[A-Z0-9][A-Z0-9\-/]{2,})"
+
+# (field, pattern, confidence, parser); the first capture group holds the value
+HEADER_PATTERNS = [
+    ("invoice_number", rf"\b(?:tax[ \t]+)?invoice[ \t]*(?:no\b|number\b|num\b|#){SEP}{NUMBER}", 0.9, str),
+    ("PO_number", rf"\b(?:P\.?O\b\.?|purchase[ \t]+order\b)[ \t]*(?:no\b|number\b|#)?{SEP}{NUMBER}", 0.85, str),
+    ("reference", rf"\b(?:account[ \t]+(?:no|number)|reference|ref)\b{SEP}{NUMBER}", 0.75, str),
+    ("invoice_date", rf"\b(?:invoice[ \t]+date|date[ \t]+of[ \t]+issue|issue[ \t]+date|tax[ \t]+point)\b{SEP}{DATE}", 0.9, parse_date),
+    ("statement_date", rf"\bstatement[ \t]+date\b{SEP}{DATE}", 0.9, parse_date),
+    ("due_date", rf"\b(?:due[ \t]+date|payment[ \t]+due|due[ \t]+by)\b{SEP}{DATE}", 0.85, parse_date),
+    ("total_amount", rf"\b(?:total[ \t]+(?:amount[ \t]+)?(?:due|payable)|amount[ \t]+(?:due|payable)|balance[ \t]+due|invoice[ \t]+total|total[ \t]+(?:\(?inc(?:l|luding)?\.?[ \t]*(?:gst|vat|tax)\)?)){SEP}{AMOUNT}", 0.9, parse_amount),
+    ("tax_amount", rf"\b(?:total[ \t]+)?(?:gst|vat|tax)\b(?:[ \t]+amount)?(?:[ \t]*\(?\d{{1,2}}(?:\.\d+)?%\)?)?{SEP}{AMOUNT}", 0.8, parse_amount),
+]
+
+# Lines a field's label may match on but that hold a different amount:
+# "Total inc GST $110.00" is the grand total, not the tax
+EXCLUDED_LINES = {
+    "tax_amount": re.compile(r"\b(?:inc|incl|including)\b\.?[ \t]*(?:gst|vat|tax)\b", re.IGNORECASE),
+}
+
+# A title line: "Tax Invoice", "STATEMENT", "Statement of Account", "Invoice #1234"
+TITLE = re.compile(
+    r"^(?:tax|sales|customer|account|monthly)?[ \t]*(invoice|statement|receipt)"
+    r"(?:[ \t]+of[ \t]+account)?[ \t]*(?:[:#\-]?[ \t]*\S*\d\S*)?$",
+    re.IGNORECASE,
+)
+
+
+def title_document_type(text: str, max_lines: int = 15) -> Optional[str]:
+    """
+    Document type from the title line of a page's text, or None.
+
+    Statements list invoice numbers near the top, so the word "invoice"
+    anywhere in the heading says little; a line that is only a title does.
+    Receipts count as invoices.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()][:max_lines]
+    for line in lines:
+        match = TITLE.match(line)
+        if match:
+            return "statement" if match.group(1).lower() == "statement" else "invoice"
+    return None
+
+
+@register_pre_extractor
+def regex_header_extractor(pages: List[PageText]) -> Dict[str, FieldMatch]:
+    """Find labelled header fields ('Invoice No:', 'Total Due', ...) in the text layer"""
+    matches: Dict[str, FieldMatch] = {}
+    for field, pattern, confidence, parse in HEADER_PATTERNS:
+        found = []
+        for page in pages:
+            for match in re.finditer(pattern, page.text, re.IGNORECASE):
+                excluded = EXCLUDED_LINES.get(field)
+                if excluded is not None:
+                    line_start = page.text.rfind("\n", 0, match.start()) + 1
+                    line_end = page.text.find("\n", match.end())
+                    if excluded.search(page.text[line_start:line_end if line_end != -1 else None]):
+                        continue
+                value = parse(match.group(1))
+                if value is not None:
+                    found.append((value, page.page_number))
+        if not found:
+            continue
+        distinct = {value for value, _ in found}
+        # Totals appear at the end of a document; other fields near the top.
+        # Conflicting values lower our confidence in the pick.
+        value, page_number = found[-1] if field in ("total_amount", "tax_amount") else found[0]
+        matches[field] = FieldMatch(
+            value=value,
+            confidence=confidence if len(distinct) == 1 else confidence * 0.7,
+            source="regex_header_extractor",
+            page_number=page_number,
+        )
+    return matches
+
+
+@register_pre_extractor
+def layout_header_extractor(pages: List[PageText]) -> Dict[str, FieldMatch]:
+    """Document type from the title line and vendor name from the line above the ABN/tax id"""
+    if not pages:
+        return {}
+    matches: Dict[str, FieldMatch] = {}
+    first_page = pages[0]
+    lines = [line.strip() for line in first_page.text.splitlines() if line.strip()]
+    document_type = title_document_type(first_page.text)
+    if document_type is not None:
+        matches["document_type"] = FieldMatch(document_type, 0.9, "layout_header_extractor", 0)
+
+    for index, line in enumerate(lines[:30]):
+        if re.search(r"\b(?:ABN|ACN|VAT\s+(?:no|reg)|GST\s+(?:no|reg)|tax\s+id)\b", line, re.IGNORECASE):
+            name = re.split(r"\b(?:ABN|ACN|VAT|GST|tax\s+id)\b", line, flags=re.IGNORECASE)[0].strip(" ,:-")
+            if not re.search(r"[A-Za-z]{2}", name) and index > 0:
+                name = lines[index - 1]
+            if re.search(r"[A-Za-z]{2}", name) and "invoice" not in name.lower():
+                matches["vendor_name"] = FieldMatch(name, 0.75, "layout_header_extractor", 0)
+            break
+    return matches
+
+
+def pre_extract(pages: List[PageText]) -> Dict[str, FieldMatch]:
+    """Run every registered pre-extractor over the usable text pages"""
+    pages = [page for page in pages if page.is_usable]
+    if not pages:
+        return {}
+    results: Dict[str, FieldMatch] = {}
+    for pre_extractor in PRE_EXTRACTORS:
+        try:
+            for field, match in pre_extractor(pages).items():
+                if field not in results or match.confidence > results[field].confidence:
+                    results[field] = match
+        except Exception as e:
+            logger.error(f"Pre-extractor {getattr(pre_extractor, '__name__', pre_extractor)} failed: {str(e)}")
+    logger.info(
+        "Pre-extracted fields: "
+        + ", ".join(f"{field}={match.value!r} ({match.confidence:.2f})" for field, match in results.items())
+    )
+    return results
+
+
+def confident_fields(matches: Dict[str, FieldMatch]) -> Dict[str, Any]:
+    """Values whose confidence reaches PRE_EXTRACT_MIN_CONFIDENCE"""
+    return {
+        field: match.value
+        for field, match in matches.items()
+        if match.confidence >= settings.PRE_EXTRACT_MIN_CONFIDENCE
+    }
+
+
+def missing_required_fields(fields: Dict[str, Any]) -> List[str]:
+    """Required InvoiceInfo fields (for the detected document type) not yet found"""
+    document_type = fields.get("document_type")
+    if document_type not in REQUIRED_FIELDS:
+        return ["document_type"]
+    return [field for field in REQUIRED_FIELDS[document_type] if fields.get(field) in (None, "")]
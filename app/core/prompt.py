@@ -1,6 +1,8 @@
-extract_prompt = """
+extraction_intro = """
 You are a specialized invoice/statement data extraction assistant. Analyze the provided invoice image. Determine if it is an invoice or a statement and then extract the following fields:
+"""
 
+invoice_fields = """
 ### For Invoices:
 - Document Type (required, must be "invoice")
 - Invoice Number (required)
@@ -12,7 +14,9 @@ You are a specialized invoice/statement data extraction assistant. Analyze the p
 - Tax Amount (optional, in numeric format)
 - PO Number (optional, Purchase Order number)
 - Line Items (optional, list of items with description, quantity, unit price, total price, and GST amount if applicable)
+"""
 
+statement_fields = """
 ### For Statements:
 - Document Type (required, must be "statement")
 - Statement Date (required, in YYYY-MM-DD format)
@@ -22,7 +26,26 @@ You are a specialized invoice/statement data extraction assistant. Analyze the p
 - Vendor Name (required)
 - Customer Name (required)
 - Line Items (optional, list of items with description, quantity, unit price, total price, and GST amount if applicable)
+"""
 
+extraction_rules = """
+Ensure all numeric values are numbers, not strings. If any optional field is missing or unclear, set it to null.
+"""
+
+extract_instructions = extraction_intro + invoice_fields + statement_fields + extraction_rules
+
+# Used when the document type is already known
+typed_extraction_intro = """
+You are a specialized invoice/statement data extraction assistant. Analyze the provided {document_type} and extract the following fields:
+"""
+
+TYPED_INSTRUCTIONS = {
+    "invoice": typed_extraction_intro.format(document_type="invoice") + invoice_fields + extraction_rules,
+    "statement": typed_extraction_intro.format(document_type="statement") + statement_fields + extraction_rules,
+}
+
+# Spelled-out output structure, for models without JSON schema response_format
+json_structure_prompt = """
 Return ONLY a valid JSON object with the following structure:
 {
     "document_type": "invoice" | "statement",
@@ -42,12 +65,113 @@ Return ONLY a valid JSON object with the following structure:
             "description": string,
             "quantity": number | null,
             "unit_price": number | null,
-            "total_price": number
+            "total_price": number,
             "gst": number | null
         }
     ] | null
 }
+"""
 
+extract_prompt = extract_instructions + json_structure_prompt
 
-Ensure all numeric values are numbers, not strings. If any optional field is missing or unclear, set it to null.
-"""
\ No newline at end of file
+system_prompt = "You are a helpful assistant that extracts information from documents. Always respond with valid JSON that matches the required schema. Include all required fields and format dates as YYYY-MM-DD."
+
+# Compact instructions, used when LLM_COMPACT_PROMPTS is set. The per-type
+# variants are used when the document type is already known.
+compact_instructions = """
+Extract the fields of this invoice or statement.
+Invoice: document_type "invoice"; required invoice_number, invoice_date, total_amount, vendor_name; optional customer_name ("Unknown Customer" if absent), due_date, tax_amount, PO_number.
+Statement: document_type "statement"; required statement_date, reference, total_amount, vendor_name, customer_name; optional statement_due_date, PO_number.
+Both: optional line_items (description, quantity, unit_price, total_price, gst). Dates YYYY-MM-DD, amounts as numbers, missing optional fields null.
+"""
+
+compact_invoice_instructions = """
+Extract the fields of this invoice. document_type is "invoice".
+Required: invoice_number, invoice_date, total_amount, vendor_name.
+Optional: customer_name ("Unknown Customer" if absent), due_date, tax_amount, PO_number, line_items (description, quantity, unit_price, total_price, gst).
+Dates YYYY-MM-DD, amounts as numbers, missing optional fields null.
+"""
+
+compact_statement_instructions = """
+Extract the fields of this statement. document_type is "statement".
+Required: statement_date, reference, total_amount, vendor_name, customer_name.
+Optional: statement_due_date, PO_number, line_items (description, quantity, unit_price, total_price, gst).
+Dates YYYY-MM-DD, amounts as numbers, missing optional fields null.
+"""
+
+COMPACT_INSTRUCTIONS = {
+    "invoice": compact_invoice_instructions,
+    "statement": compact_statement_instructions,
+}
+
+# Long tables are extracted in row bands (see table_bands): one request for
+# the header fields, one per band for the rows
+header_only_note = """
+The line item table is extracted separately: set line_items to null.
+"""
+
+line_items_prompt = """
+You are given one part of a document's line item table; the column headings, if any, come first. Extract every row as a line item with description, quantity, unit price, total price and GST amount if applicable. Skip subtotal, tax, total and balance rows, and rows cut off at the top or bottom edge. Ensure all numeric values are numbers, not strings; set missing values to null.
+"""
+
+line_items_structure_prompt = """
+Return ONLY a valid JSON object with the following structure:
+{
+    "line_items": [
+        {
+            "description": string,
+            "quantity": number | null,
+            "unit_price": number | null,
+            "total_price": number,
+            "gst": number | null
+        }
+    ]
+}
+"""
+
+# Every prompt text, for the extraction cache's prompt version
+ALL_PROMPTS = (
+    system_prompt,
+    extract_instructions,
+    json_structure_prompt,
+    compact_instructions,
+    *TYPED_INSTRUCTIONS.values(),
+    *COMPACT_INSTRUCTIONS.values(),
+    header_only_note,
+    line_items_prompt,
+    line_items_structure_prompt,
+)
+
+
+def build_prompt(document_type=None, structured=False, compact=False, part="document"):
+    """
+    The static part of an extraction request, and a short name for it.
+
+    The text depends only on these arguments, never on the page, so it forms
+    a stable prefix that providers can cache across requests. A known
+    document_type ("invoice" or "statement") picks the prompt for that type
+    only; the output structure is spelled out unless structured outputs
+    enforce it. part is "document" (everything), "header" (everything but
+    the line items) or "line_items" (rows of a table band only).
+    """
+    if part == "line_items":
+        prompt = f"{system_prompt}\n{line_items_prompt}"
+        if not structured:
+            prompt += line_items_structure_prompt
+        return prompt, f"line_items{'-schema' if structured else ''}"
+
+    if document_type not in TYPED_INSTRUCTIONS:
+        document_type = None
+    if compact:
+        instructions = COMPACT_INSTRUCTIONS.get(document_type, compact_instructions)
+    else:
+        instructions = TYPED_INSTRUCTIONS.get(document_type, extract_instructions)
+    prompt = f"{system_prompt}\n{instructions}"
+    if part == "header":
+        prompt += header_only_note
+    if not structured:
+        prompt += json_structure_prompt
+    variant = f"{document_type or 'any'}-{'compact' if compact else 'full'}{'-schema' if structured else ''}"
+    if part == "header":
+        variant += "-header"
+    return prompt, variant
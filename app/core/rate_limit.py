@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRateLimiter:
+    """
+    Concurrency limiter plus token bucket for outgoing LLM requests.
+
+    At most max_concurrency requests are in flight at once and, when
+    requests_per_second is positive, request starts are spaced by a token
+    bucket that allows bursts of up to burst requests. One instance is shared
+    by the whole process (all LLM calls run on the shared LLM event loop).
+    """
+
+    def __init__(self, max_concurrency: int, requests_per_second: float = 0, burst: int = 1):
+        self.max_concurrency = max(1, max_concurrency)
+        self.requests_per_second = requests_per_second
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the loop that actually runs the requests
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _reserve_token(self) -> float:
+        """Take a token from the bucket and return how long to wait before using it"""
+        if self.requests_per_second <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                float(self.burst),
+                self._tokens + (now - self._updated_at) * self.requests_per_second,
+            )
+            self._updated_at = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.requests_per_second
+
+    async def __aenter__(self):
+        await self._get_semaphore().acquire()
+        delay = self._reserve_token()
+        if delay > 0:
+            logger.info(f"Rate limit reached, delaying LLM request by {delay:.2f}s")
+            try:
+                await asyncio.sleep(delay)
+            except BaseException:
+                # Cancelled while waiting (e.g. a losing hedge): __aexit__ never runs
+                self._get_semaphore().release()
+                raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._get_semaphore().release()
+        return False
@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import openai
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits, server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class CircuitOpenError(RuntimeError):
+    """The model's circuit breaker is open; the request was not sent"""
+
+
+class CircuitBreaker:
+    """
+    Per-model circuit breaker.
+
+    After failure_threshold consecutive retryable failures the circuit opens
+    and requests fail fast for reset_timeout seconds. Then one trial request
+    is let through (half-open): success closes the circuit, failure opens it
+    again.
+    """
+
+    def __init__(self, model: str, failure_threshold: int, reset_timeout: float):
+        self.model = model
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info(f"Circuit for {self.model} closed")
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def release_trial(self):
+        """Let another trial through after one ended without an answer (cancelled)"""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            logger.warning(
+                f"Circuit for {self.model} opened after {self.failures} failures, "
+                f"retrying in {self.reset_timeout}s"
+            )
+
+
+class LatencyTracker:
+    """Sliding window of successful request latencies per model"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, model: str, seconds: float):
+        self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model: str, quantile: float, min_samples: int = 1) -> Optional[float]:
+        samples = self._samples.get(model)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+# Shared state; only touched from the LLM event loop, so no locking is needed
+_breakers: Dict[str, CircuitBreaker] = {}
+latency_tracker = LatencyTracker()
+
+
+def get_circuit_breaker(model: str) -> CircuitBreaker:
+    if model not in _breakers:
+        _breakers[model] = CircuitBreaker(
+            model,
+            failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.LLM_CIRCUIT_RESET_TIMEOUT,
+        )
+    return _breakers[model]
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Transient failures: timeouts, dropped connections, 408/409/429 and 5xx"""
+    if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Delay requested by the server (Retry-After / retry-after-ms headers), if any"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        retry_after = headers.get("retry-after")
+        if not retry_after:
+            return None
+        try:
+            return float(retry_after)
+        except ValueError:
+            # HTTP-date form
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Exponential backoff with full jitter, or the server's Retry-After (capped)"""
+    if retry_after is not None:
+        return min(settings.LLM_BACKOFF_MAX, retry_after + random.uniform(0, settings.LLM_BACKOFF_BASE))
+    return random.uniform(0, min(settings.LLM_BACKOFF_MAX, settings.LLM_BACKOFF_BASE * 2 ** attempt))
+
+
+async def _hedged(model: str, attempt: Callable[[], Awaitable[T]]) -> T:
+    """
+    Run attempt; if it is slower than the model's recent p95 latency, start a
+    second identical request and return whichever succeeds first.
+    """
+    threshold = None
+    if settings.LLM_HEDGE_ENABLED:
+        threshold = latency_tracker.percentile(
+            model, settings.LLM_HEDGE_PERCENTILE, min_samples=settings.LLM_HEDGE_MIN_SAMPLES
+        )
+    primary = asyncio.ensure_future(attempt())
+    if threshold is None:
+        return await primary
+
+    tasks = [primary]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=threshold)
+        if done:
+            return primary.result()
+
+        logger.info(f"{model} slower than p95 ({threshold:.1f}s), sending a hedged request")
+        tasks.append(asyncio.ensure_future(attempt()))
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        # Whatever is still running lost the race (or we were cancelled)
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def call_with_resilience(
+    model: str,
+    request: Callable[[], Awaitable[T]],
+    limiter=None,
+    hedge: bool = True,
+) -> T:
+    """
+    Send an LLM request with timeouts, retries, hedging and a circuit breaker.
+
+    request is called once per attempt (and once more per hedge), inside
+    limiter when one is given, so queueing for a slot does not count towards
+    the per-request deadline (LLM_TIMEOUT) or the latency statistics. Only
+    hedged calls feed the latency statistics. Retryable failures are retried
+    up to LLM_MAX_RETRIES times with jittered exponential backoff, honoring
+    Retry-After; other errors are raised at once. Raises CircuitOpenError
+    when the model's circuit is open.
+    """
+    breaker = get_circuit_breaker(model)
+
+    async def attempt() -> T:
+        if limiter is None:
+            return await timed()
+        async with limiter:
+            return await timed()
+
+    async def timed() -> T:
+        started = time.monotonic()
+        result = await asyncio.wait_for(request(), timeout=settings.LLM_TIMEOUT)
+        if hedge:
+            latency_tracker.record(model, time.monotonic() - started)
+        return result
+
+    for retry in range(settings.LLM_MAX_RETRIES + 1):
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit for {model} is open")
+        try:
+            result = await (_hedged(model, attempt) if hedge else attempt())
+        except asyncio.CancelledError:
+            # Says nothing about the model, but a half-open trial must not stay claimed
+            breaker.release_trial()
+            raise
+        except Exception as e:
+            if not is_retryable(e):
+                # The provider answered (e.g. 400): not a health problem
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            if retry == settings.LLM_MAX_RETRIES:
+                raise
+            delay = backoff_delay(retry, retry_after_seconds(e))
+            logger.warning(
+                f"{model} request failed ({type(e).__name__}: {str(e) or 'timeout'}), "
+                f"retry {retry + 1}/{settings.LLM_MAX_RETRIES} in {delay:.1f}s"
+            )
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
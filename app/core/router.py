@@ -0,0 +1,170 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.core.resilience import get_circuit_breaker
+
+logger = logging.getLogger(__name__)
+
+# Model id that asks the router to pick (and fall back between) models
+AUTO_MODEL = "auto"
+
+# Weight of the newest observation in the moving averages
+EWMA_ALPHA = 0.2
+# Failure rates halve every STATS_HALF_LIFE seconds without traffic, so a
+# demoted model gets another chance once its problems are likely over
+STATS_HALF_LIFE = 300.0
+
+
+@dataclass
+class ModelStats:
+    """Live routing statistics for one model"""
+
+    latency: Optional[float] = None  # Seconds per page, moving average
+    error_rate: float = 0.0  # No usable output (timeouts, API errors)
+    validation_failure_rate: float = 0.0  # Output that failed schema validation
+    requests: int = 0
+    updated_at: float = field(default_factory=time.monotonic)
+
+    def _decay(self) -> float:
+        return 0.5 ** ((time.monotonic() - self.updated_at) / STATS_HALF_LIFE)
+
+    @property
+    def quality(self) -> float:
+        """Share of recent requests that produced a valid result"""
+        decay = self._decay()
+        return max(0.0, 1.0 - (self.error_rate + self.validation_failure_rate) * decay)
+
+    def record(self, latency: Optional[float], error: bool, validation_failed: bool):
+        decay = self._decay()
+        self.error_rate = _ewma(self.error_rate * decay, float(error))
+        self.validation_failure_rate = _ewma(self.validation_failure_rate * decay, float(validation_failed))
+        if latency is not None:
+            self.latency = latency if self.latency is None else _ewma(self.latency, latency)
+        self.requests += 1
+        self.updated_at = time.monotonic()
+
+
+def _ewma(average: float, value: float) -> float:
+    return (1 - EWMA_ALPHA) * average + EWMA_ALPHA * value
+
+
+def default_chain() -> List[str]:
+    """The configured OPENROUTER_MODEL_* models, roughly cheapest first"""
+    models = [
+        settings.OPENROUTER_MODEL_QWEN,
+        settings.OPENROUTER_MODEL_GEMINI,
+        settings.OPENROUTER_MODEL_AMAZON,
+        settings.OPENROUTER_MODEL_GEMMA,
+        settings.OPENROUTER_MODEL_MISTRAL,
+        settings.OPENROUTER_MODEL_GPT,
+        settings.OPENROUTER_MODEL_LLAMA,
+    ]
+    return list(dict.fromkeys(model for model in models if model))
+
+
+class ModelRouter:
+    """
+    Picks the models to try for a request when the "auto" model is selected.
+
+    chain is the preference order (cheapest first). With the "chain" policy
+    the first healthy model in that order is used; with "weighted" the
+    healthy models are ranked by a mix of chain position and live latency
+    (MODEL_ROUTING_LATENCY_WEIGHT). Models whose quality (the share of recent
+    requests with valid output) is below MODEL_ROUTING_MIN_QUALITY go to the
+    back of the queue, and models with an open circuit are skipped.
+    """
+
+    def __init__(self, chain: List[str], policy: str = "chain"):
+        self.chain = chain
+        self.policy = policy
+        self.stats: Dict[str, ModelStats] = {model: ModelStats() for model in chain}
+
+    def _stats(self, model: str) -> ModelStats:
+        return self.stats.setdefault(model, ModelStats())
+
+    def _weighted(self, models: List[str]) -> List[str]:
+        latencies = [self._stats(model).latency for model in models]
+        known = [latency for latency in latencies if latency is not None]
+        if not known:
+            return models
+        # Models without samples are ranked as average, so they still get traffic
+        average = sum(known) / len(known)
+        slowest = max(known)
+        weight = settings.MODEL_ROUTING_LATENCY_WEIGHT
+        last_rank = max(1, len(self.chain) - 1)
+
+        def score(model: str, latency: Optional[float]) -> float:
+            rank = self.chain.index(model) if model in self.chain else last_rank
+            latency = average if latency is None else latency
+            return (1 - weight) * rank / last_rank + weight * latency / slowest
+
+        scored = sorted(zip(models, latencies), key=lambda item: score(*item))
+        return [model for model, _ in scored]
+
+    def candidates(self, limit: Optional[int] = None, preferred: Optional[str] = None) -> List[str]:
+        """
+        Models to try in order, best first.
+
+        preferred (e.g. the classifier's model tier for the document) goes
+        first while it is healthy, and need not be in the chain.
+        """
+        chain = list(self.chain)
+        if preferred and preferred not in chain:
+            chain.append(preferred)
+        available = [model for model in chain if get_circuit_breaker(model).state != "open"]
+        if not available:
+            # Every circuit is open: keep the order, the calls fail fast anyway
+            available = chain
+
+        healthy = [model for model in available if self._stats(model).quality >= settings.MODEL_ROUTING_MIN_QUALITY]
+        degraded = [model for model in available if model not in healthy]
+        if self.policy == "weighted":
+            healthy = self._weighted(healthy)
+        if preferred in healthy:
+            healthy.remove(preferred)
+            healthy.insert(0, preferred)
+        ordered = healthy + sorted(degraded, key=lambda model: -self._stats(model).quality)
+        return ordered[: limit or settings.MODEL_ROUTING_MAX_ATTEMPTS]
+
+    def select(self) -> str:
+        """The single best model right now"""
+        return self.candidates(limit=1)[0]
+
+    def record(self, model: str, latency: Optional[float], error: bool = False, validation_failed: bool = False):
+        """Record the outcome of one extraction by model (latency in seconds per page)"""
+        self._stats(model).record(latency, error, validation_failed)
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        """Current statistics per model, for display"""
+        return [
+            {
+                "model": model,
+                "requests": stats.requests,
+                "latency": round(stats.latency, 2) if stats.latency is not None else None,
+                "error_rate": round(stats.error_rate, 3),
+                "validation_failure_rate": round(stats.validation_failure_rate, 3),
+                "quality": round(stats.quality, 3),
+                "circuit": get_circuit_breaker(model).state,
+            }
+            for model, stats in self.stats.items()
+        ]
+
+
+def _configured_chain() -> List[str]:
+    chain = [model.strip() for model in settings.MODEL_ROUTING_CHAIN.split(",") if model.strip()]
+    return list(dict.fromkeys(chain)) or default_chain()
+
+
+# Shared router; updated from the LLM event loop
+model_router = ModelRouter(_configured_chain(), policy=settings.MODEL_ROUTING_POLICY)
+
+
+def resolve_model(model: Optional[str]) -> str:
+    """The model to call for a request: the given one, or the router's pick for "auto" """
+    model = model or settings.OPENROUTER_MODEL
+    if model == AUTO_MODEL:
+        return model_router.select()
+    return model
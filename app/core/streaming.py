@@ -0,0 +1,153 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from pydantic import ValidationError
+
+from app.model.extracted_model import LineItem
+
+logger = logging.getLogger(__name__)
+
+
+class MalformedStreamError(ValueError):
+    """The streamed completion can no longer become a valid JSON object"""
+
+
+class IncrementalJSONParser:
+    """
+    Incremental parser for a streamed JSON object of InvoiceInfo shape.
+
+    feed() accepts completion chunks as they arrive and returns the events
+    that became complete: {"type": "field", "name", "value"} for each
+    top-level field, and {"type": "line_item", "index", "item"} for each
+    validated element of line_items. Raises MalformedStreamError as soon as
+    the output cannot be a JSON object any more, so the caller can stop the
+    stream instead of waiting for max_tokens of garbage.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.started = False
+        self.finished = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.expect = "key"  # key -> colon -> value -> comma (at depth 1)
+        self.key: Optional[str] = None
+        self.key_start = 0
+        self.value_start: Optional[int] = None
+        self.item_start: Optional[int] = None
+        self.item_index = 0
+
+    def _skip_preamble(self) -> bool:
+        """Skip whitespace and an optional ```json fence before the opening brace"""
+        stripped = self.buffer.lstrip()
+        if len(stripped) < 3 and stripped == "`" * len(stripped):
+            # Possibly a fence split across chunks; wait for more
+            return False
+        if stripped.startswith("```"):
+            newline = stripped.find("\n")
+            if newline == -1:
+                return False
+            stripped = stripped[newline + 1:].lstrip()
+        if not stripped:
+            return False
+        if stripped[0] != "{":
+            raise MalformedStreamError(f"Expected a JSON object, got {stripped[:20]!r}")
+        self.position = len(self.buffer) - len(stripped)
+        self.started = True
+        return True
+
+    def _complete_value(self, end: int) -> Dict[str, Any]:
+        raw = self.buffer[self.value_start:end].strip()
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise MalformedStreamError(f"Invalid value for {self.key}: {raw[:40]!r} ({str(e)})")
+        self.value_start = None
+        self.expect = "comma"
+        return {"type": "field", "name": self.key, "value": value}
+
+    def _complete_item(self, end: int) -> Dict[str, Any]:
+        raw = self.buffer[self.item_start:end]
+        self.item_start = None
+        try:
+            item = json.loads(raw)
+            LineItem(**item)
+        except (json.JSONDecodeError, TypeError, ValidationError) as e:
+            raise MalformedStreamError(f"Invalid line item {self.item_index}: {str(e)}")
+        event = {"type": "line_item", "index": self.item_index, "item": item}
+        self.item_index += 1
+        return event
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        if self.finished or not chunk:
+            return []
+        self.buffer += chunk
+        if not self.started and not self._skip_preamble():
+            return []
+
+        events = []
+        while self.position < len(self.buffer):
+            index = self.position
+            char = self.buffer[index]
+            self.position += 1
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.expect == "key_string":
+                        self.key = json.loads(self.buffer[self.key_start:index + 1])
+                        self.expect = "colon"
+                    elif self.depth == 1 and self.value_start is not None:
+                        events.append(self._complete_value(index + 1))
+                continue
+
+            if self.depth == 1 and self.value_start is not None and char in " \t\r\n,}":
+                # End of a number or true/false/null; re-read the terminator
+                events.append(self._complete_value(index))
+                self.position = index
+                continue
+
+            if self.depth == 1 and self.expect in ("key", "colon", "comma") and not char.isspace():
+                if self.expect == "key" and char == '"':
+                    self.in_string = True
+                    self.key_start = index
+                    self.expect = "key_string"
+                elif self.expect == "colon" and char == ":":
+                    self.expect = "value"
+                elif self.expect == "comma" and char == ",":
+                    self.expect = "key"
+                elif char == "}" and self.expect in ("key", "comma"):
+                    self.depth = 0
+                    self.finished = True
+                    return events
+                else:
+                    raise MalformedStreamError(f"Unexpected {char!r} while expecting {self.expect}")
+                continue
+
+            if self.depth == 1 and self.expect == "value" and self.value_start is None:
+                if char.isspace():
+                    continue
+                if char in ",:}]":
+                    raise MalformedStreamError(f"Missing value for {self.key}")
+                self.value_start = index
+
+            if char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+                if self.key == "line_items" and self.depth == 3 and char == "{":
+                    self.item_start = index
+            elif char in "}]":
+                self.depth -= 1
+                if self.item_start is not None and self.depth == 2:
+                    events.append(self._complete_item(index + 1))
+                elif self.depth == 1 and self.value_start is not None:
+                    events.append(self._complete_value(index + 1))
+        return events
@@ -0,0 +1,134 @@
+import copy
+import logging
+from typing import Any, Dict
+
+from app.config import settings
+from app.model.extracted_model import InvoiceInfo
+
+logger = logging.getLogger(__name__)
+
+# Top-level fields a page may legitimately lack; the merged document is
+# validated against InvoiceInfo afterwards, so every field except the
+# document type is nullable in the per-page schema
+NON_NULLABLE_FIELDS = {"document_type"}
+
+# Keywords strict schema mode rejects or ignores
+DROPPED_KEYWORDS = ("title", "default", "format")
+
+
+def _simplify(node: Dict[str, Any], defs: Dict[str, Any]) -> Dict[str, Any]:
+    """Inline $refs and turn pydantic's Decimal/date schemas into plain JSON types"""
+    if "$ref" in node:
+        return _simplify(defs[node["$ref"].split("/")[-1]], defs)
+
+    node = {key: value for key, value in node.items() if key not in DROPPED_KEYWORDS}
+    if node.get("anyOf"):
+        options = [_simplify(option, defs) for option in node.pop("anyOf")]
+        types = [option.get("type") for option in options]
+        nullable = "null" in types
+        options = [option for option in options if option.get("type") != "null"]
+        # Decimal is number-or-string in pydantic's schema; ask for numbers
+        if {"number", "string"} <= set(types):
+            options = [{"type": "number"}]
+        if len(options) == 1:
+            node.update(options[0])
+            if nullable:
+                node["type"] = [node["type"], "null"]
+        else:
+            node["anyOf"] = options + ([{"type": "null"}] if nullable else [])
+
+    if node.get("type") == "object":
+        properties = {name: _simplify(value, defs) for name, value in node.get("properties", {}).items()}
+        node["properties"] = properties
+        # Strict mode: every property listed, nothing extra
+        node["required"] = list(properties)
+        node["additionalProperties"] = False
+    elif node.get("type") == "array":
+        node["items"] = _simplify(node["items"], defs)
+    return node
+
+
+def _nullable(node: Dict[str, Any]) -> Dict[str, Any]:
+    node = dict(node)
+    if "anyOf" in node:
+        if {"type": "null"} not in node["anyOf"]:
+            node["anyOf"] = node["anyOf"] + [{"type": "null"}]
+    elif isinstance(node.get("type"), list):
+        if "null" not in node["type"]:
+            node["type"] = node["type"] + ["null"]
+    else:
+        node["type"] = [node["type"], "null"]
+    return node
+
+
+def extraction_schema() -> Dict[str, Any]:
+    """
+    JSON schema for one page of extraction output, derived from InvoiceInfo.
+
+    Refs are inlined and Decimal/date fields become number/string, since
+    providers differ in which JSON schema features they accept.
+    """
+    schema = copy.deepcopy(InvoiceInfo.model_json_schema())
+    schema = _simplify(schema, schema.pop("$defs", {}))
+    for name, value in schema["properties"].items():
+        if name not in NON_NULLABLE_FIELDS:
+            schema["properties"][name] = _nullable(value)
+    for name in ("invoice_date", "due_date", "statement_date", "statement_due_date"):
+        schema["properties"][name]["description"] = "YYYY-MM-DD"
+    return schema
+
+
+EXTRACTION_SCHEMA = extraction_schema()
+
+# response_format for chat completions (OpenAI structured outputs)
+RESPONSE_FORMAT: Dict[str, Any] = {
+    "type": "json_schema",
+    "json_schema": {"name": "invoice_info", "strict": True, "schema": EXTRACTION_SCHEMA},
+}
+
+# Table bands only return rows
+LINE_ITEMS_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {"line_items": {**EXTRACTION_SCHEMA["properties"]["line_items"], "type": "array"}},
+    "required": ["line_items"],
+    "additionalProperties": False,
+}
+
+LINE_ITEMS_RESPONSE_FORMAT: Dict[str, Any] = {
+    "type": "json_schema",
+    "json_schema": {"name": "line_items", "strict": True, "schema": LINE_ITEMS_SCHEMA},
+}
+
+# OpenRouter only routes to providers that honor response_format, and answers
+# 404 (or 400) when a model has none, which switches that model to prompt-only
+EXTRA_BODY: Dict[str, Any] = {"provider": {"require_parameters": True}}
+
+# Models that rejected response_format; they get the schema in the prompt instead
+_unsupported_models = set()
+
+
+def supports_structured_output(model: str) -> bool:
+    return settings.LLM_STRUCTURED_OUTPUTS and model not in _unsupported_models
+
+
+# Error messages that mean the model (or every provider for it) rejected the schema
+UNSUPPORTED_MARKERS = ("response_format", "json_schema", "structured output", "no endpoints")
+
+
+def is_unsupported_error(error: Exception) -> bool:
+    """
+    Whether a 400/404 is about response_format itself. Other bad requests
+    (context length, image size) must not switch the model to prompt-only.
+    """
+    message = str(error).lower()
+    return any(marker in message for marker in UNSUPPORTED_MARKERS)
+
+
+def mark_unsupported(model: str, error: Exception):
+    """Stop sending response_format to a model that rejected it"""
+    if model not in _unsupported_models:
+        logger.warning(
+            f"{model} does not accept a JSON schema response_format, "
+            f"falling back to prompt-only JSON: {str(error)}"
+        )
+        _unsupported_models.add(model)
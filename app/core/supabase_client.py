@@ -1,188 +1,616 @@
 import os
 import logging
 import json
-from typing import Dict, Any, List, Optional
-from datetime import datetime
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+from datetime import date, datetime
+from decimal import Decimal
 
 import psycopg2
-from psycopg2.extras import RealDictCursor, Json
+from psycopg2 import extensions, pool
+from psycopg2.extras import RealDictCursor, Json, execute_values
+from app.core.migrations import run_migrations
 from app.model.extracted_model import InvoiceInfo, LineItem
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Errors that may mean the connection (not the query) failed; see _connection_lost
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+def _connection_lost(error: Exception) -> bool:
+    """Whether an error means the connection is gone, not just that the query failed
+    
+    OperationalError also covers server-side query failures (QueryCanceled,
+    deadlocks, serialization failures), which carry their SQLSTATE. Lost
+    connections are InterfaceErrors, SQLSTATE class 08 (connection exception),
+    errors raised by libpq itself (no SQLSTATE) or leave the connection closed.
+    """
+    if isinstance(error, psycopg2.InterfaceError):
+        return True
+    if not isinstance(error, psycopg2.OperationalError):
+        return False
+    if error.pgcode is None or error.pgcode.startswith("08"):
+        return True
+    cursor = getattr(error, "cursor", None)
+    return cursor is not None and bool(cursor.connection.closed)
+
+def _dump_json(value: Any) -> str:
+    """json.dumps that writes Decimal amounts (as in model_dump() output) as numbers"""
+    return json.dumps(value, default=lambda o: float(o) if isinstance(o, Decimal) else str(o))
+
+
+# Columns written for each table
+INVOICE_FIELDS = [
+    "document_type", "invoice_number", "invoice_date", "total_amount", 
+    "vendor_name", "customer_name", "due_date", "tax_amount", 
+    "PO_number", "reference", "line_items", "uploaded_at", "filename", "file_hash"
+]
+
+STATEMENT_FIELDS = [
+    "document_type", "statement_date", "total_amount", 
+    "vendor_name", "customer_name", "reference", "statement_due_date",
+    "PO_number", "line_items", "uploaded_at", "filename", "file_hash"
+]
+
+# Natural keys of a document besides lower(vendor_name), matching the unique
+# indexes of migration 6
+NATURAL_KEYS = {
+    "invoices": ("invoice_number", "total_amount"),
+    "statements": ("reference", "statement_date", "total_amount"),
+}
+
+# Columns shown in the history tables (line_items is loaded separately)
+HISTORY_COLUMNS = {
+    "invoices": [
+        "id", "document_type", "invoice_number", "invoice_date", "total_amount",
+        "vendor_name", "customer_name", "due_date", "uploaded_at", "filename"
+    ],
+    "statements": [
+        "id", "document_type", "statement_date", "total_amount",
+        "vendor_name", "customer_name", "reference", "uploaded_at", "filename"
+    ],
+}
+
+# Per-table columns behind the search filters
+DATE_COLUMNS = {"invoices": "invoice_date", "statements": "statement_date"}
+NUMBER_COLUMNS = {"invoices": ("invoice_number", "PO_number"), "statements": ("reference", "PO_number")}
+
+# Must match the expression of the line item GIN indexes (migration 4)
+LINE_ITEM_TEXT = "to_tsvector('english', jsonb_path_query_array(line_items, '$[*].description'))"
+
+
+def _contains(term: str) -> str:
+    """ILIKE pattern matching term anywhere, with LIKE wildcards in term escaped"""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
 class PostgresClient:
-    """Client for interacting with PostgreSQL database"""
+    """Client for interacting with PostgreSQL database
+    
+    Connections come from a bounded thread-safe pool and are checked out per
+    operation, so concurrent Streamlit sessions and API workers do not share
+    (and serialize on) a single socket.
+    """
     
     def __init__(self):
         """Initialize PostgreSQL client with environment variables"""
         # Try to get connection string from settings first, then from environment
         self.connection_string = settings.POSTGRES_CONNECTION_STRING or os.getenv("SUPABASE_URL")
-        self.connection = None
+        self.pool: Optional[pool.ThreadedConnectionPool] = None
+        self._pool_lock = threading.Lock()
+        # ThreadedConnectionPool raises instead of blocking when exhausted, so
+        # callers wait for a free slot here first
+        self._slots = threading.BoundedSemaphore(settings.POSTGRES_POOL_MAX)
+        # Last known health and when it was observed (time.monotonic)
+        self._healthy: Optional[bool] = None
+        self._health_checked_at = 0.0
         
         if self.connection_string:
-            try:
-                self.connection = psycopg2.connect(self.connection_string)
-                logger.info("PostgreSQL connection initialized successfully")
-            except Exception as e:
-                logger.error(f"Failed to initialize PostgreSQL connection: {str(e)}")
+            self._ensure_pool()
         else:
             logger.warning("PostgreSQL connection string not found in environment variables")
     
-    def is_connected(self) -> bool:
-        """Check if PostgreSQL client is connected"""
-        if self.connection:
-            try:
-                # Check if connection is still alive
-                with self.connection.cursor() as cursor:
-                    cursor.execute("SELECT 1")
-                    return True
-            except Exception:
-                # Try to reconnect
+    def _ensure_pool(self) -> bool:
+        """Create the connection pool if it does not exist yet
+        
+        Pending schema migrations run once, right after the pool is created,
+        so queries never need DDL or catalog checks of their own.
+        """
+        if self.pool is not None:
+            return True
+        if not self.connection_string or self._health_is_fresh():
+            # Don't retry a failed connect on every call within the health TTL
+            return False
+        created = False
+        with self._pool_lock:
+            if self.pool is None:
                 try:
-                    self.connection = psycopg2.connect(self.connection_string)
-                    return True
+                    self.pool = pool.ThreadedConnectionPool(
+                        settings.POSTGRES_POOL_MIN, settings.POSTGRES_POOL_MAX, self.connection_string
+                    )
+                    created = True
+                    logger.info(
+                        f"PostgreSQL connection pool initialized "
+                        f"({settings.POSTGRES_POOL_MIN}-{settings.POSTGRES_POOL_MAX} connections)"
+                    )
                 except Exception as e:
-                    logger.error(f"Failed to reconnect to PostgreSQL: {str(e)}")
+                    logger.error(f"Failed to initialize PostgreSQL connection pool: {str(e)}")
+                    self._set_health(False)
                     return False
-        return False
+        if created and settings.POSTGRES_RUN_MIGRATIONS:
+            self.migrate()
+        return True
+    
+    def _set_health(self, healthy: bool):
+        self._healthy = healthy
+        self._health_checked_at = time.monotonic()
+    
+    def _health_is_fresh(self) -> bool:
+        return (
+            self._healthy is not None
+            and time.monotonic() - self._health_checked_at < settings.POSTGRES_HEALTH_TTL
+        )
     
-    def save_invoice(self, invoice_data: Dict[str, Any], filename: str) -> Dict[str, Any]:
-        """Save invoice data to PostgreSQL"""
-        if not self.is_connected():
+    def _checkout(self):
+        """Get a pooled connection, replacing any that fail the local health check"""
+        connection = self.pool.getconn()
+        # Checked without a round trip: connections closed after an error or left
+        # mid-transaction are discarded and a fresh one is opened instead
+        if connection.closed or connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            self.pool.putconn(connection, close=True)
+            connection = self.pool.getconn()
+        return connection
+    
+    @contextmanager
+    def _connection(self):
+        """Check out a connection for one operation and return it to the pool afterwards
+        
+        Any transaction still open when the block exits (an uncommitted read or
+        a failed write) is rolled back; connections that cannot be rolled back
+        are closed instead of being reused. The outcome also refreshes the cached
+        health state, so active use keeps is_connected() from probing.
+        """
+        if not self._ensure_pool():
+            raise pool.PoolError("PostgreSQL client not connected")
+        if not self._slots.acquire(timeout=settings.POSTGRES_POOL_TIMEOUT):
+            raise pool.PoolError("Timed out waiting for a PostgreSQL connection")
+        try:
+            connection = self._checkout()
+            try:
+                yield connection
+            except Exception as e:
+                # Unless the connection itself was lost, the server answered
+                self._set_health(not (_connection_lost(e) or connection.closed))
+                raise
+            else:
+                self._set_health(True)
+            finally:
+                broken = bool(connection.closed)
+                if not broken and connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    try:
+                        connection.rollback()
+                    except Exception:
+                        broken = True
+                self.pool.putconn(connection, close=broken)
+        finally:
+            self._slots.release()
+    
+    def is_connected(self) -> bool:
+        """Check if PostgreSQL client is connected
+        
+        Returns the last observed health while it is younger than
+        POSTGRES_HEALTH_TTL (any database operation refreshes it), and only
+        then pays a round trip to check.
+        """
+        if self._health_is_fresh():
+            return self._healthy
+        if not self._ensure_pool():
+            return False
+        try:
+            with self._connection() as connection, connection.cursor() as cursor:
+                # Check if connection is still alive
+                cursor.execute("SELECT 1")
+                return True
+        except Exception as e:
+            logger.error(f"Failed to reach PostgreSQL: {str(e)}")
+            self._set_health(False)
+            return False
+    
+    def migrate(self) -> Dict[str, Any]:
+        """Apply pending schema migrations (see app/core/migrations.py)"""
+        if not self._ensure_pool():
             return {"success": False, "error": "PostgreSQL client not connected"}
         
         try:
-            # Determine document type and table
-            document_type = invoice_data.get("document_type")
-            if not document_type:
-                return {"success": False, "error": "Missing document_type in data"}
+            with self._connection() as connection:
+                version = run_migrations(connection)
+            logger.info(f"Database schema at version {version}")
+            return {"success": True, "version": version}
+        except Exception as e:
+            logger.error(f"Error running database migrations: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    def _read(self, query: Callable[[RealDictCursor], T]) -> T:
+        """Run an idempotent read, retrying on a fresh connection if the connection drops
+        
+        A dropped connection is closed rather than returned to the pool, so the
+        retry reconnects. Writes are not retried: a commit may have reached the
+        server before the connection was lost.
+        """
+        for attempt in range(settings.POSTGRES_READ_RETRIES + 1):
+            try:
+                with self._connection() as connection, connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                    return query(cursor)
+            except CONNECTION_ERRORS as e:
+                if not _connection_lost(e) or attempt == settings.POSTGRES_READ_RETRIES:
+                    raise
+                logger.warning(f"PostgreSQL connection lost, retrying read: {str(e)}")
+    
+    @staticmethod
+    def _document_row(invoice_data: Dict[str, Any], filename: str, uploaded_at: datetime, file_hash: Optional[str] = None):
+        """Target table and column values for one extracted document"""
+        table_name = "invoices" if invoice_data.get("document_type") == "invoice" else "statements"
+        
+        # Convert line items to JSON
+        line_items = invoice_data.get("line_items") or []
+        line_items_json = Json(
+            [item.model_dump() if hasattr(item, 'model_dump') else item for item in line_items],
+            dumps=_dump_json,
+        )
+        
+        # Create a new dict with only the fields for the specific table
+        allowed_fields = INVOICE_FIELDS if table_name == "invoices" else STATEMENT_FIELDS
+        filtered_dict = {k: v for k, v in invoice_data.items() if k in allowed_fields}
+        
+        # Add line items as JSON and metadata
+        filtered_dict["line_items"] = line_items_json
+        filtered_dict["uploaded_at"] = uploaded_at
+        filtered_dict["filename"] = filename
+        filtered_dict["file_hash"] = file_hash
+        return table_name, filtered_dict
+    
+    @staticmethod
+    def _find_duplicate(cursor, table_name: str, row: Dict[str, Any]) -> Optional[int]:
+        """Id of the saved document with the same file hash or natural key"""
+        keys = NATURAL_KEYS[table_name]
+        cursor.execute(
+            f"""
+            SELECT id FROM {table_name}
+            WHERE duplicate_of IS NULL
+            AND (file_hash = %s OR (lower(vendor_name) = lower(%s) AND {' AND '.join(f'{key} = %s' for key in keys)}))
+            ORDER BY id
+            LIMIT 1
+            """,
+            [row.get("file_hash"), row.get("vendor_name")] + [row.get(key) for key in keys],
+        )
+        result = cursor.fetchone()
+        return result[0] if result else None
+    
+    @staticmethod
+    def _merge_duplicate(cursor, table_name: str, record_id: int, row: Dict[str, Any]):
+        """Fill in the saved document's empty fields with the new values, keeping its identity
+        
+        Values already saved are never overwritten. Natural key columns are
+        left alone so the merge cannot collide with another document; line
+        items are filled only when the saved document has none.
+        """
+        identity = {"document_type", "vendor_name", "uploaded_at", "filename", "file_hash", "line_items"}
+        columns = [
+            column for column in (INVOICE_FIELDS if table_name == "invoices" else STATEMENT_FIELDS)
+            if column not in identity and column not in NATURAL_KEYS[table_name]
+        ]
+        assignments = [f"{column} = COALESCE({column}, %s)" for column in columns]
+        assignments.append("line_items = COALESCE(NULLIF(line_items, '[]'::jsonb), NULLIF(%s::jsonb, '[]'::jsonb), line_items)")
+        assignments.append("file_hash = COALESCE(file_hash, %s)")
+        cursor.execute(
+            f"UPDATE {table_name} SET {', '.join(assignments)} WHERE id = %s",
+            [row.get(column) for column in columns] + [row["line_items"], row.get("file_hash"), record_id],
+        )
+    
+    def _insert_rows(self, cursor, table_name: str, rows: List[Dict[str, Any]], page_size: int) -> List[Tuple[int, bool]]:
+        """Insert rows into one table, resolving duplicates; returns (record id, is duplicate) per row
+        
+        Ids are reserved from the table's sequence up front, so rows skipped by
+        ON CONFLICT DO NOTHING are known without matching RETURNING output
+        back to the input. Skipped rows are resolved to the document they
+        duplicate and, with POSTGRES_DUPLICATE_POLICY=merge, merged into it.
+        """
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            (table_name, len(rows)),
+        )
+        reserved = [record_id for (record_id,) in cursor.fetchall()]
+        
+        # Every row gets every column (missing fields are NULL) so they share
+        # one VALUES template
+        columns = INVOICE_FIELDS if table_name == "invoices" else STATEMENT_FIELDS
+        inserted = {
+            record_id for (record_id,) in execute_values(
+                cursor,
+                f"INSERT INTO {table_name} (id, {', '.join(columns)}) VALUES %s ON CONFLICT DO NOTHING RETURNING id",
+                [(record_id,) + tuple(row.get(column) for column in columns) for record_id, row in zip(reserved, rows)],
+                page_size=page_size,
+                fetch=True,
+            )
+        }
+        
+        results = []
+        for record_id, row in zip(reserved, rows):
+            if record_id in inserted:
+                results.append((record_id, False))
+                continue
+            existing_id = self._find_duplicate(cursor, table_name, row)
+            if existing_id is None:
+                raise RuntimeError(f"Insert into {table_name} was skipped but no duplicate was found")
+            if settings.POSTGRES_DUPLICATE_POLICY == "merge":
+                self._merge_duplicate(cursor, table_name, existing_id, row)
+            results.append((existing_id, True))
+        return results
+    
+    def save_invoice(self, invoice_data: Dict[str, Any], filename: str, file_hash: Optional[str] = None) -> Dict[str, Any]:
+        """Save invoice data to PostgreSQL
+        
+        file_hash is the SHA-256 of the original file (see
+        cache.hash_file_bytes). A document whose file hash or natural key
+        (vendor, number/reference, date, total) is already saved is rejected
+        with duplicate=True and the existing record_id, or merged into it when
+        POSTGRES_DUPLICATE_POLICY is merge.
+        """
+        result = self.save_invoices_bulk([(invoice_data, filename, file_hash)])
+        if not result["success"]:
+            return result
+        
+        record_id, table_name = result["record_ids"][0], result["tables"][0]
+        if not result["duplicates"]:
+            return {
+                "success": True, 
+                "record_id": record_id,
+                "table": table_name
+            }
+        if settings.POSTGRES_DUPLICATE_POLICY == "merge":
+            return {
+                "success": True,
+                "record_id": record_id,
+                "table": table_name,
+                "duplicate": True
+            }
+        return {
+            "success": False,
+            "record_id": record_id,
+            "table": table_name,
+            "duplicate": True,
+            "error": f"Document already saved in {table_name} with ID {record_id}"
+        }
+    
+    def save_invoices_bulk(self, documents: List[Tuple], page_size: int = 500) -> Dict[str, Any]:
+        """Save many extracted documents in one transaction
+        
+        documents is a list of (invoice_data, filename) or (invoice_data,
+        filename, file_hash) tuples. Rows are grouped by target table and
+        inserted with multi-row INSERTs (page_size rows per statement) and a
+        single commit, so either every document is saved or none is.
+        record_ids and tables are aligned with the input order; duplicates
+        lists the input positions that matched an already saved document
+        (their record_id is that document's, see save_invoice).
+        """
+        if not self._ensure_pool():
+            return {"success": False, "error": "PostgreSQL client not connected"}
+        if not documents:
+            return {"success": True, "record_ids": [], "tables": [], "duplicates": []}
+        
+        # Group rows by table, remembering each row's position in the input
+        uploaded_at = datetime.now()
+        grouped: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+        for index, (invoice_data, filename, *file_hash) in enumerate(documents):
+            if not invoice_data.get("document_type"):
+                return {"success": False, "error": f"Missing document_type in document {index} ({filename})"}
+            table_name, row = self._document_row(
+                invoice_data, filename, uploaded_at, file_hash[0] if file_hash else None
+            )
+            grouped.setdefault(table_name, []).append((index, row))
+        
+        record_ids: List[Optional[int]] = [None] * len(documents)
+        tables: List[Optional[str]] = [None] * len(documents)
+        duplicates: List[int] = []
+        try:
+            with self._connection() as connection, connection.cursor() as cursor:
+                for table_name, rows in grouped.items():
+                    results = self._insert_rows(cursor, table_name, [row for _, row in rows], page_size)
+                    for (index, _), (record_id, duplicate) in zip(rows, results):
+                        record_ids[index] = record_id
+                        tables[index] = table_name
+                        if duplicate:
+                            duplicates.append(index)
                 
-            table_name = "invoices" if document_type == "invoice" else "statements"
+                # Commit the whole batch at once
+                connection.commit()
+            
+            if len(documents) > 1:
+                logger.info(
+                    f"Bulk saved {len(documents)} documents ("
+                    + ", ".join(f"{len(rows)} {table}" for table, rows in grouped.items())
+                    + f", {len(duplicates)} duplicates)"
+                )
+            return {
+                "success": True,
+                "record_ids": record_ids,
+                "tables": tables,
+                "duplicates": sorted(duplicates)
+            }
+        
+        except Exception as e:
+            # The pooled connection is rolled back when it is returned
+            logger.error(f"Error bulk saving to PostgreSQL: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    def get_recent_documents(self, limit: int = 10) -> Dict[str, Any]:
+        """Get recent documents from both invoices and statements tables"""
+        if not self._ensure_pool():
+            return {"success": False, "error": "PostgreSQL client not connected"}
+        
+        def fetch(cursor):
+            # Get recent invoices
+            cursor.execute("""
+            SELECT * FROM invoices
+            ORDER BY uploaded_at DESC
+            LIMIT %s
+            """, (limit,))
             
-            # Extract line items and convert to JSON
-            line_items = invoice_data.pop("line_items", [])
-            line_items_json = Json([item.model_dump() if hasattr(item, 'model_dump') else item for item in line_items])
+            invoices = cursor.fetchall()
             
-            # Define fields for each table
-            invoice_fields = [
-                "document_type", "invoice_number", "invoice_date", "total_amount", 
-                "vendor_name", "customer_name", "due_date", "tax_amount", 
-                "PO_number", "reference", "line_items", "uploaded_at", "filename"
-            ]
+            # Get recent statements
+            cursor.execute("""
+            SELECT * FROM statements
+            ORDER BY uploaded_at DESC
+            LIMIT %s
+            """, (limit,))
             
-            statement_fields = [
-                "document_type", "statement_date", "total_amount", 
-                "vendor_name", "customer_name", "reference", "statement_due_date",
-                "PO_number", "line_items", "uploaded_at", "filename"
-            ]
+            statements = cursor.fetchall()
             
-            # Create a new dict with only the fields for the specific table
-            allowed_fields = invoice_fields if table_name == "invoices" else statement_fields
-            filtered_dict = {k: v for k, v in invoice_data.items() if k in allowed_fields}
+            return {
+                "success": True,
+                "invoices": invoices,
+                "statements": statements
+            }
+        
+        try:
+            return self._read(fetch)
+        except Exception as e:
+            logger.error(f"Error fetching recent documents: {str(e)}")
+            return {"success": False, "error": str(e)}
             
-            # Add line items as JSON and metadata
-            filtered_dict["line_items"] = line_items_json
-            filtered_dict["uploaded_at"] = datetime.now()
-            filtered_dict["filename"] = filename
+    def get_document_history(self, table: str, limit: int = 10, after: Optional[Tuple[datetime, int]] = None) -> Dict[str, Any]:
+        """Get one page of document summaries, newest first
+        
+        Uses keyset pagination on (uploaded_at, id): pass the next_cursor of a
+        page as after to get the following one, which costs the same index
+        range scan however deep the page is. next_cursor is None on the last
+        page.
+        """
+        return self.search_documents(table, limit=limit, after=after)
+    
+    def search_documents(
+        self,
+        table: str,
+        vendor: Optional[str] = None,
+        customer: Optional[str] = None,
+        number: Optional[str] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        min_amount: Optional[Decimal] = None,
+        max_amount: Optional[Decimal] = None,
+        text: Optional[str] = None,
+        limit: int = 10,
+        after: Optional[Tuple[datetime, int]] = None,
+    ) -> Dict[str, Any]:
+        """Search document summaries in the database, newest first
+        
+        vendor, customer and number (invoice/PO number for invoices,
+        reference/PO number for statements) match case-insensitively anywhere
+        in the value; dates filter the invoice or statement date; text is a
+        full-text query over line item descriptions. All filters are optional
+        and combined with AND. Paginated like get_document_history.
+        """
+        if table not in HISTORY_COLUMNS:
+            return {"success": False, "error": f"Unknown document table: {table}"}
+        if not self._ensure_pool():
+            return {"success": False, "error": "PostgreSQL client not connected"}
+        
+        # Rows flagged as duplicates by migration 6 are hidden
+        conditions: List[str] = ["duplicate_of IS NULL"]
+        params: List[Any] = []
+        if vendor:
+            conditions.append("vendor_name ILIKE %s")
+            params.append(_contains(vendor))
+        if customer:
+            conditions.append("customer_name ILIKE %s")
+            params.append(_contains(customer))
+        if number:
+            conditions.append("(" + " OR ".join(f"{column} ILIKE %s" for column in NUMBER_COLUMNS[table]) + ")")
+            params.extend([_contains(number)] * len(NUMBER_COLUMNS[table]))
+        if date_from:
+            conditions.append(f"{DATE_COLUMNS[table]} >= %s")
+            params.append(date_from)
+        if date_to:
+            conditions.append(f"{DATE_COLUMNS[table]} <= %s")
+            params.append(date_to)
+        if min_amount is not None:
+            conditions.append("total_amount >= %s")
+            params.append(min_amount)
+        if max_amount is not None:
+            conditions.append("total_amount <= %s")
+            params.append(max_amount)
+        if text:
+            conditions.append(f"{LINE_ITEM_TEXT} @@ websearch_to_tsquery('english', %s)")
+            params.append(text)
+        if after is not None:
+            conditions.append("(uploaded_at, id) < (%s, %s)")
+            params.extend(after)
+        
+        def fetch(cursor):
+            query = f"SELECT {', '.join(HISTORY_COLUMNS[table])} FROM {table}"
+            query += " WHERE " + " AND ".join(conditions)
+            # One extra row tells us whether there is a next page
+            query += " ORDER BY uploaded_at DESC, id DESC LIMIT %s"
             
-            # Create cursor with dictionary factory
-            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                # Build the SQL query dynamically
-                columns = list(filtered_dict.keys())
-                placeholders = ["%s"] * len(columns)
-                values = [filtered_dict[col] for col in columns]
-                
-                # Insert into appropriate table
-                query = f"""
-                INSERT INTO {table_name} ({', '.join(columns)})
-                VALUES ({', '.join(placeholders)})
-                RETURNING id
-                """
-                
-                cursor.execute(query, values)
-                result = cursor.fetchone()
-                
-                if not result:
-                    return {"success": False, "error": "Failed to insert data"}
-                
-                # Get the inserted record ID
-                record_id = result["id"]
-                
-                # Commit the transaction
-                self.connection.commit()
-                
-                return {
-                    "success": True, 
-                    "record_id": record_id,
-                    "table": table_name
-                }
+            cursor.execute(query, params + [limit + 1])
+            documents = cursor.fetchall()
             
+            next_cursor = None
+            if len(documents) > limit:
+                documents = documents[:limit]
+                next_cursor = (documents[-1]["uploaded_at"], documents[-1]["id"])
+            return {
+                "success": True,
+                "documents": documents,
+                "next_cursor": next_cursor
+            }
+        
+        try:
+            return self._read(fetch)
         except Exception as e:
-            # Rollback in case of error
-            self.connection.rollback()
-            logger.error(f"Error saving to PostgreSQL: {str(e)}")
+            logger.error(f"Error searching documents: {str(e)}")
             return {"success": False, "error": str(e)}
     
-    def get_recent_documents(self, limit: int = 10) -> Dict[str, Any]:
-        """Get recent documents from both invoices and statements tables"""
-        if not self.is_connected():
+    def get_document_line_items(self, table: str, document_id: int) -> Dict[str, Any]:
+        """Get the line items of a single document"""
+        if table not in HISTORY_COLUMNS:
+            return {"success": False, "error": f"Unknown document table: {table}"}
+        if not self._ensure_pool():
             return {"success": False, "error": "PostgreSQL client not connected"}
         
+        def fetch(cursor):
+            cursor.execute(f"SELECT line_items FROM {table} WHERE id = %s", (document_id,))
+            row = cursor.fetchone()
+            if not row:
+                return {"success": False, "error": f"Document {document_id} not found"}
+            line_items = row["line_items"] or []
+            # Handle JSON string or Python object
+            if isinstance(line_items, str):
+                line_items = json.loads(line_items)
+            return {"success": True, "line_items": line_items}
+        
         try:
-            # Create cursor with dictionary factory
-            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                # Get recent invoices
-                cursor.execute("""
-                SELECT * FROM invoices
-                ORDER BY uploaded_at DESC
-                LIMIT %s
-                """, (limit,))
-                
-                invoices = cursor.fetchall()
-                
-                # Get recent statements
-                cursor.execute("""
-                SELECT * FROM statements
-                ORDER BY uploaded_at DESC
-                LIMIT %s
-                """, (limit,))
-                
-                statements = cursor.fetchall()
-                
-                return {
-                    "success": True,
-                    "invoices": invoices,
-                    "statements": statements
-                }
-            
+            return self._read(fetch)
         except Exception as e:
-            logger.error(f"Error fetching recent documents: {str(e)}")
+            logger.error(f"Error fetching line items: {str(e)}")
             return {"success": False, "error": str(e)}
             
     def save_rating(self, filename: str, document_type: str, model: str, rating: int, 
                    comment: str = None, document_id: int = None) -> Dict[str, Any]:
         """Save user rating for extraction quality"""
-        if not self.is_connected():
+        if not self._ensure_pool():
             return {"success": False, "error": "PostgreSQL client not connected"}
         
         try:
             # Create cursor with dictionary factory
-            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                # Check if the ratings table exists, create it if not
-                cursor.execute("""
-                CREATE TABLE IF NOT EXISTS ratings (
-                    id SERIAL PRIMARY KEY,
-                    filename TEXT NOT NULL,
-                    document_type TEXT NOT NULL,
-                    model TEXT NOT NULL,
-                    rating INTEGER NOT NULL,
-                    comment TEXT,
-                    document_id INTEGER NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-                """)
-                
+            with self._connection() as connection, connection.cursor(cursor_factory=RealDictCursor) as cursor:
                 # Insert the rating
                 query = """
                 INSERT INTO ratings 
@@ -211,7 +639,7 @@ class PostgresClient:
                 record_id = result["id"]
                 
                 # Commit the transaction
-                self.connection.commit()
+                connection.commit()
                 
                 return {
                     "success": True, 
@@ -219,52 +647,39 @@ class PostgresClient:
                 }
             
         except Exception as e:
-            # Rollback in case of error
-            self.connection.rollback()
+            # The pooled connection is rolled back when it is returned
             logger.error(f"Error saving rating to PostgreSQL: {str(e)}")
             return {"success": False, "error": str(e)}
             
     def get_document_ratings(self, document_id: int = None, document_type: str = None) -> Dict[str, Any]:
         """Get ratings for a specific document or document type"""
-        if not self.is_connected():
+        if not self._ensure_pool():
             return {"success": False, "error": "PostgreSQL client not connected"}
         
-        try:
-            # Create cursor with dictionary factory
-            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                # Check if the ratings table exists
-                cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = 'ratings'
-                )
-                """)
-                
-                table_exists = cursor.fetchone()["exists"]
-                if not table_exists:
-                    return {"success": True, "ratings": []}
-                
-                # Build query based on parameters
-                query = "SELECT * FROM ratings"
-                params = []
-                
-                if document_id is not None:
-                    query += " WHERE document_id = %s"
-                    params.append(document_id)
-                elif document_type is not None:
-                    query += " WHERE document_type = %s"
-                    params.append(document_type)
-                
-                query += " ORDER BY created_at DESC"
-                
-                cursor.execute(query, params)
-                ratings = cursor.fetchall()
-                
-                return {
-                    "success": True,
-                    "ratings": ratings
-                }
+        def fetch(cursor):
+            # Build query based on parameters
+            query = "SELECT * FROM ratings"
+            params = []
+            
+            if document_id is not None:
+                query += " WHERE document_id = %s"
+                params.append(document_id)
+            elif document_type is not None:
+                query += " WHERE document_type = %s"
+                params.append(document_type)
             
+            query += " ORDER BY created_at DESC"
+            
+            cursor.execute(query, params)
+            ratings = cursor.fetchall()
+            
+            return {
+                "success": True,
+                "ratings": ratings
+            }
+        
+        try:
+            return self._read(fetch)
         except Exception as e:
             logger.error(f"Error fetching ratings: {str(e)}")
             return {"success": False, "error": str(e)}
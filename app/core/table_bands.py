@@ -0,0 +1,165 @@
+import logging
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from app.config import settings
+from app.core.pre_extract import AMOUNT
+
+logger = logging.getLogger(__name__)
+
+# Lines that end in an amount are line items, unless they are totals
+AMOUNT_LINE = re.compile(AMOUNT + r"\s*$")
+TOTAL_LINE = re.compile(r"\b(?:sub\s*-?total|total|tax|gst|vat|balance|amount\s+due|paid|change)\b", re.IGNORECASE)
+
+# Image pages: pixels darker than INK_LEVEL are ink, a pixel row holds text
+# when at least INK_MIN_SHARE of it is ink, and a line of text is at least
+# MIN_LINE_HEIGHT pixels tall (thinner runs are rules)
+INK_LEVEL = 128
+INK_MIN_SHARE = 0.004
+MIN_LINE_HEIGHT = 3
+BAND_PADDING = 4  # Pixels kept above and below each image band
+
+
+@dataclass
+class BandPlan:
+    """How one page is split: a header request plus one request per table band"""
+
+    header_text: Optional[str] = None  # Text layer without the table rows (text pages)
+    text_bands: List[str] = field(default_factory=list)
+    image_bands: List[Image.Image] = field(default_factory=list)
+
+    @property
+    def bands(self) -> list:
+        return self.text_bands or self.image_bands
+
+
+def is_item_line(line: str) -> bool:
+    line = line.strip()
+    return bool(AMOUNT_LINE.search(line)) and not TOTAL_LINE.search(line)
+
+
+def estimate_line_items(text: str) -> int:
+    """Count the lines of a page's text layer that look like priced items"""
+    return sum(1 for line in text.splitlines() if is_item_line(line))
+
+
+def _chunks(count: int, size: int, overlap: int) -> List[Tuple[int, int]]:
+    """[start, end) ranges of size rows, each repeating overlap rows of the one before"""
+    overlap = max(0, min(overlap, size - 1))
+    ranges, start = [], 0
+    while True:
+        end = min(count, start + size)
+        ranges.append((start, end))
+        if end == count:
+            return ranges
+        start = end - overlap
+
+
+def plan_text_bands(text: str) -> Optional[BandPlan]:
+    """
+    Split a text-layer page whose table has more than LINE_ITEM_BAND_ROWS rows.
+
+    The table region runs from the first to the last item-like line; the line
+    just above it (usually the column headings) is repeated in every band.
+    Everything outside the region goes to the header request.
+    """
+    lines = text.splitlines()
+    item_lines = [index for index, line in enumerate(lines) if is_item_line(line)]
+    if len(item_lines) <= settings.LINE_ITEM_BAND_ROWS:
+        return None
+
+    first, last = item_lines[0], item_lines[-1]
+    table = lines[first:last + 1]
+    column_header = lines[first - 1] if first > 0 else ""
+    bands = [
+        "\n".join([column_header] + table[start:end]).strip("\n")
+        for start, end in _chunks(len(table), settings.LINE_ITEM_BAND_ROWS, settings.LINE_ITEM_BAND_OVERLAP)
+    ]
+    header_text = "\n".join(lines[:first] + ["[... line item table omitted ...]"] + lines[last + 1:])
+    return BandPlan(header_text=header_text, text_bands=bands)
+
+
+def find_text_lines(image: Image.Image) -> List[Tuple[int, int]]:
+    """(top, bottom) pixel rows of each line of text on a page image, from its horizontal ink profile"""
+    ink = image.convert("L").point(lambda value: 255 if value < INK_LEVEL else 0)
+    profile = list(ink.resize((1, image.height), Image.BOX).getdata())
+    threshold = max(1, 255 * INK_MIN_SHARE)
+    lines, top = [], None
+    for y, value in enumerate(profile + [0]):
+        inked = value >= threshold
+        if inked and top is None:
+            top = y
+        elif not inked and top is not None:
+            if y - top >= MIN_LINE_HEIGHT:
+                lines.append((top, y))
+            top = None
+    return lines
+
+
+def plan_image_bands(image: Image.Image) -> Optional[BandPlan]:
+    """
+    Split a page image into overlapping horizontal strips of text lines.
+
+    Without a text layer the table cannot be told apart from the header, so
+    only very dense pages (more than twice LINE_ITEM_BAND_ROWS lines of text)
+    are split; grid tables whose vertical rules join every row stay whole.
+    """
+    lines = find_text_lines(image)
+    if len(lines) <= 2 * settings.LINE_ITEM_BAND_ROWS:
+        return None
+    bands = []
+    for start, end in _chunks(len(lines), settings.LINE_ITEM_BAND_ROWS, settings.LINE_ITEM_BAND_OVERLAP):
+        top = max(0, lines[start][0] - BAND_PADDING)
+        bottom = min(image.height, lines[end - 1][1] + BAND_PADDING)
+        bands.append(image.crop((0, top, image.width, bottom)))
+    return BandPlan(image_bands=bands)
+
+
+def plan_bands(image: Optional[Image.Image], page_text=None) -> Optional[BandPlan]:
+    """Band plan for a page, or None when it is extracted in one request"""
+    if not settings.LINE_ITEM_BANDING:
+        return None
+    if page_text is not None and page_text.is_usable:
+        return plan_text_bands(page_text.text)
+    if image is not None:
+        return plan_image_bands(image)
+    return None
+
+
+def _item_key(item: Dict[str, Any]) -> Tuple[str, str]:
+    description = " ".join(str(item.get("description") or "").lower().split())
+    return description, _decimal_text(item.get("total_price"))
+
+
+def _decimal_text(value) -> str:
+    try:
+        return str(Decimal(str(value)).quantize(Decimal("0.01")))
+    except (InvalidOperation, ValueError):
+        return str(value)
+
+
+def stitch_bands(bands: List[List[Dict[str, Any]]], overlap: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Concatenate per-band line items, dropping the rows repeated at band edges.
+
+    Rows are matched on description and total price. Only the longest run at
+    the end of one band that reappears at the start of the next is dropped
+    (at most overlap + 1 rows, since a row cut in half may show up in both),
+    so identical items elsewhere in the table are kept.
+    """
+    overlap = settings.LINE_ITEM_BAND_OVERLAP if overlap is None else overlap
+    stitched: List[Dict[str, Any]] = []
+    for items in bands:
+        items = list(items or [])
+        duplicated = 0
+        for size in range(min(overlap + 1, len(stitched), len(items)), 0, -1):
+            if [_item_key(item) for item in stitched[-size:]] == [_item_key(item) for item in items[:size]]:
+                duplicated = size
+                break
+        stitched.extend(items[duplicated:])
+    return stitched
+
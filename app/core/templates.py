@@ -0,0 +1,270 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.core.pre_extract import AMOUNT, DATE, parse_amount, parse_date
+from app.core.text_layer import PageText, Word, extract_text_layer
+
+logger = logging.getLogger(__name__)
+
+# Fields located by coordinates, and how their text is parsed. Customer names
+# change per document and vary in length, so a box learned from one document
+# would cut them off; they are left to the LLM.
+FIELD_KINDS = {
+    "invoice_number": "text",
+    "PO_number": "text",
+    "reference": "text",
+    "invoice_date": "date",
+    "due_date": "date",
+    "statement_date": "date",
+    "statement_due_date": "date",
+    "total_amount": "amount",
+    "tax_amount": "amount",
+}
+
+# Fields that are the same on every document of a template
+CONSTANT_FIELDS = ("document_type", "vendor_name")
+
+# Share of the first page (from the top) used to fingerprint the layout
+FINGERPRINT_REGION = 0.3
+
+
+def fingerprint_tokens(page: PageText) -> List[str]:
+    """Static-looking words (no digits) from the header region of a page"""
+    limit = page.height * FINGERPRINT_REGION
+    tokens = {
+        re.sub(r"[^a-z]", "", word[4].lower())
+        for word in page.words
+        if word[1] < limit and not re.search(r"\d", word[4])
+    }
+    return sorted(token for token in tokens if len(token) >= 3)
+
+
+def _similarity(a: List[str], b: List[str]) -> float:
+    a_set, b_set = set(a), set(b)
+    if not a_set or not b_set:
+        return 0.0
+    return len(a_set & b_set) / len(a_set | b_set)
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _locate(page: PageText, value: Any, kind: str) -> Optional[Tuple[float, float, float, float]]:
+    """Find the bounding box of a value among a page's words (up to 6 consecutive words)"""
+    words = page.words
+    candidates = []
+    for start in range(len(words)):
+        for length in range(1, 7):
+            span = words[start:start + length]
+            if len(span) < length or span[-1][6] != span[0][6] or span[-1][5] != span[0][5]:
+                break  # Stay on one line
+            text = " ".join(word[4] for word in span)
+            if kind == "amount":
+                matched = parse_amount(text) == Decimal(str(value)).quantize(Decimal("0.01"))
+            elif kind == "date":
+                matched = bool(re.search(r"\d", text)) and parse_date(text) == str(value)
+            else:
+                matched = _normalize(text) == _normalize(str(value))
+            if matched:
+                candidates.append((
+                    min(word[0] for word in span), min(word[1] for word in span),
+                    max(word[2] for word in span), max(word[3] for word in span),
+                ))
+                break
+    if not candidates:
+        return None
+    # Totals are printed last; everything else is taken from its first occurrence
+    return candidates[-1] if kind == "amount" else candidates[0]
+
+
+def _read_region(page: PageText, bbox: List[float], kind: str) -> str:
+    """Text of the words whose centres fall inside a (relative) bounding box
+
+    Values vary in length between documents, so the box is widened on the side
+    the value grows towards: right for text and dates, left for amounts.
+    """
+    pad = settings.TEMPLATE_BBOX_PADDING
+    grow = pad * 8
+    pad_left, pad_right = (grow, pad) if kind == "amount" else (pad, grow)
+    x0, x1 = (bbox[0] - pad_left) * page.width, (bbox[2] + pad_right) * page.width
+    # Vertical slack is relative to the line height so neighbouring lines stay out
+    pad_y = (bbox[3] - bbox[1]) * page.height * 0.25
+    y0, y1 = bbox[1] * page.height - pad_y, bbox[3] * page.height + pad_y
+    inside: List[Word] = [
+        word for word in page.words
+        if x0 <= (word[0] + word[2]) / 2 <= x1 and y0 <= (word[1] + word[3]) / 2 <= y1
+    ]
+    if kind == "text":
+        # A wide gap means the next word belongs to another column or label
+        kept = inside[:1]
+        for word in inside[1:]:
+            if word[0] - kept[-1][2] > pad * 2 * page.width:
+                break
+            kept.append(word)
+        inside = kept
+    return " ".join(word[4] for word in inside)
+
+
+class TemplateStore:
+    """
+    Learned vendor layouts, stored in SQLite.
+
+    A template records the header fingerprint of a well-rated document and the
+    relative position of each field on the page, so later documents with the
+    same layout can be read by coordinates instead of by the LLM. Templates
+    need a PDF text layer; scanned documents always go to the LLM.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            yield connection
+            connection.commit()
+        finally:
+            connection.close()
+
+    def _ensure_schema(self):
+        if self._initialized:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+            CREATE TABLE IF NOT EXISTS vendor_templates (
+                fingerprint TEXT PRIMARY KEY,
+                vendor_name TEXT NOT NULL,
+                document_type TEXT NOT NULL,
+                tokens TEXT NOT NULL,
+                fields TEXT NOT NULL,
+                uses INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+            """)
+        self._initialized = True
+
+    def learn(self, file_bytes: bytes, extracted: Dict[str, Any]) -> bool:
+        """Record the layout of a document whose extraction was rated well"""
+        try:
+            pages = extract_text_layer(file_bytes)
+            if not pages or not pages[0].is_usable:
+                logger.info("No usable text layer, not learning a template")
+                return False
+            tokens = fingerprint_tokens(pages[0])
+            if not tokens:
+                return False
+
+            fields: Dict[str, Any] = {}
+            for field, kind in FIELD_KINDS.items():
+                value = extracted.get(field)
+                if value in (None, "", "Unknown Customer"):
+                    continue
+                for page in pages:
+                    bbox = _locate(page, value, kind)
+                    if bbox:
+                        fields[field] = {
+                            "kind": kind,
+                            "page": page.page_number,
+                            "bbox": [bbox[0] / page.width, bbox[1] / page.height,
+                                     bbox[2] / page.width, bbox[3] / page.height],
+                        }
+                        break
+            for field in CONSTANT_FIELDS:
+                if extracted.get(field):
+                    fields[field] = {"kind": "constant", "value": extracted[field]}
+
+            fingerprint = hashlib.sha256(" ".join(tokens).encode("utf-8")).hexdigest()
+            with self._lock:
+                self._ensure_schema()
+                with self._connect() as connection:
+                    connection.execute(
+                        """
+                        INSERT OR REPLACE INTO vendor_templates
+                        (fingerprint, vendor_name, document_type, tokens, fields, uses, updated_at)
+                        VALUES (?, ?, ?, ?, ?, 0, ?)
+                        """,
+                        (fingerprint, extracted["vendor_name"], extracted["document_type"],
+                         json.dumps(tokens), json.dumps(fields), time.time()),
+                    )
+            logger.info(f"Learned template for {extracted['vendor_name']} with fields {sorted(fields)}")
+            return True
+        except Exception as e:
+            logger.error(f"Error learning vendor template: {str(e)}")
+            return False
+
+    def match(self, pages: List[PageText]) -> Dict[str, Any]:
+        """Read fields by coordinates from the best matching template ({} if none)"""
+        if not pages or not pages[0].is_usable:
+            return {}
+        try:
+            tokens = fingerprint_tokens(pages[0])
+            with self._lock:
+                self._ensure_schema()
+                with self._connect() as connection:
+                    rows = connection.execute(
+                        "SELECT fingerprint, vendor_name, tokens, fields FROM vendor_templates"
+                    ).fetchall()
+            best = max(rows, key=lambda row: _similarity(tokens, json.loads(row[2])), default=None)
+            if best is None or _similarity(tokens, json.loads(best[2])) < settings.TEMPLATE_MATCH_THRESHOLD:
+                return {}
+
+            fingerprint, vendor_name, _, fields_json = best
+            # Vendors on the same billing software share a layout; the template
+            # (and its vendor name) only applies when that vendor is on the page
+            if _normalize(vendor_name) not in _normalize(" ".join(page.text for page in pages)):
+                logger.info(f"Layout matches the template for {vendor_name}, but the vendor name is not on the page")
+                return {}
+
+            values: Dict[str, Any] = {}
+            for field, spec in json.loads(fields_json).items():
+                if spec["kind"] == "constant":
+                    values[field] = spec["value"]
+                    continue
+                if field not in FIELD_KINDS:
+                    # Learned before the field was dropped (customer_name)
+                    continue
+                if spec["page"] >= len(pages):
+                    continue
+                text = _read_region(pages[spec["page"]], spec["bbox"], spec["kind"])
+                if spec["kind"] == "amount":
+                    amounts = re.findall(AMOUNT, text)
+                    value = parse_amount(amounts[-1]) if amounts else None
+                elif spec["kind"] == "date":
+                    dates = re.findall(DATE, text)
+                    value = parse_date(dates[0]) if dates else None
+                else:
+                    value = text or None
+                if value is not None:
+                    values[field] = value
+
+            with self._lock, self._connect() as connection:
+                connection.execute(
+                    "UPDATE vendor_templates SET uses = uses + 1 WHERE fingerprint = ?", (fingerprint,)
+                )
+            logger.info(f"Matched template for {vendor_name}: {sorted(values)}")
+            return values
+        except Exception as e:
+            logger.error(f"Error matching vendor template: {str(e)}")
+            return {}
+
+
+# Create a singleton instance
+template_store = TemplateStore(settings.TEMPLATE_STORE_PATH)
@@ -0,0 +1,59 @@
+import logging
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+import fitz  # PyMuPDF
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# (x0, y0, x1, y1, word, block_no, line_no, word_no) as returned by page.get_text("words")
+Word = Tuple[float, float, float, float, str, int, int, int]
+
+
+@dataclass
+class PageText:
+    """Text layer of a single PDF page"""
+
+    page_number: int  # 0-based
+    text: str
+    width: float
+    height: float
+    words: List[Word] = field(default_factory=list)
+
+    @property
+    def is_usable(self) -> bool:
+        """Enough real text to extract from without looking at the image"""
+        stripped = "".join(self.text.split())
+        if len(stripped) < settings.TEXT_LAYER_MIN_CHARS:
+            return False
+        # Broken font encodings produce replacement characters and symbol soup
+        readable = sum(1 for char in stripped if char.isalnum())
+        return readable / len(stripped) >= settings.TEXT_LAYER_MIN_ALNUM_RATIO
+
+
+def extract_text_layer(pdf_bytes) -> List[PageText]:
+    """Return the text layer of every page of a PDF (layout-preserving reading order)"""
+    if hasattr(pdf_bytes, "getvalue"):
+        pdf_bytes = pdf_bytes.getvalue()
+    pages = []
+    try:
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_document:
+            for page in pdf_document:
+                pages.append(
+                    PageText(
+                        page_number=page.number,
+                        text=page.get_text("text", sort=True),
+                        width=page.rect.width,
+                        height=page.rect.height,
+                        words=page.get_text("words", sort=True),
+                    )
+                )
+    except Exception as e:
+        logger.error(f"Error reading PDF text layer: {str(e)}")
+        return []
+
+    usable = sum(1 for page in pages if page.is_usable)
+    logger.info(f"Text layer usable on {usable} of {len(pages)} page(s)")
+    return pages
@@ -0,0 +1,64 @@
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PromptUsage:
+    """Token totals for one model and prompt variant"""
+
+    requests: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class TokenUsageTracker:
+    """Per-request prompt token counts, aggregated by model and prompt variant"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usage: Dict[Tuple[str, str], PromptUsage] = {}
+
+    def record(self, model: str, variant: str, usage) -> Optional[int]:
+        """Record a completion's usage object; returns its prompt token count"""
+        if usage is None:
+            logger.info(f"No token usage reported for {model} ({variant})")
+            return None
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+        completion_tokens = getattr(usage, "completion_tokens", None) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details else 0
+        logger.info(
+            f"Token usage for {model} ({variant}): prompt_tokens={prompt_tokens} "
+            f"(cached={cached_tokens}), completion_tokens={completion_tokens}"
+        )
+        with self._lock:
+            totals = self._usage.setdefault((model, variant), PromptUsage())
+            totals.requests += 1
+            totals.prompt_tokens += prompt_tokens
+            totals.cached_tokens += cached_tokens
+            totals.completion_tokens += completion_tokens
+        return prompt_tokens
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        """Totals and average prompt tokens per model and prompt variant"""
+        with self._lock:
+            return [
+                {
+                    "model": model,
+                    "variant": variant,
+                    "requests": totals.requests,
+                    "prompt_tokens": totals.prompt_tokens,
+                    "avg_prompt_tokens": round(totals.prompt_tokens / totals.requests),
+                    "cached_tokens": totals.cached_tokens,
+                    "completion_tokens": totals.completion_tokens,
+                }
+                for (model, variant), totals in self._usage.items()
+            ]
+
+
+token_usage = TokenUsageTracker()
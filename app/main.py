@@ -0,0 +1,12 @@
+import logging.config
+
+from fastapi import FastAPI
+
+from app.api import router
+from app.config import settings
+from app.logging_settings import default_settings
+
+logging.config.dictConfig(default_settings)
+
+app = FastAPI(title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json")
+app.include_router(router, prefix=settings.API_V1_STR)
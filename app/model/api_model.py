@@ -0,0 +1,16 @@
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class ExtractionResult(BaseModel):
+    filename: str
+    success: bool
+    data: Optional[Dict[str, Any]] = None  # InvoiceInfo.model_dump() on success
+    error: Optional[str] = None
+
+
+class BatchExtractionResponse(BaseModel):
+    results: List[ExtractionResult]
+    succeeded: int
+    failed: int
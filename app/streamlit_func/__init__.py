@@ -1,3 +1,4 @@
+from app.streamlit_func.batch_extraction import display_batch_extraction
 from app.streamlit_func.display_history import display_history
 from app.streamlit_func.display_line_items import display_line_items
 from app.streamlit_func.save_to_database import save_to_database
@@ -7,6 +8,7 @@ from app.streamlit_func.model_selection import display_model_selection
 from app.streamlit_func.rating_component import display_rating_component
 
 __all__ = [
+    "display_batch_extraction",
     "display_history", 
     "display_line_items", 
     "save_to_database",
@@ -0,0 +1,138 @@
+import hashlib
+import logging
+
+import streamlit as st
+
+from app.config import settings
+from app.core.batch import expand_uploads, extract_batch
+from app.core.convert_to_image import ALLOWED_FILE_TYPES
+from app.core.supabase_client import postgres
+
+logger = logging.getLogger(__name__)
+
+STATUS_LABELS = {
+    "queued": "⏳ Queued",
+    "processing": "🔄 Processing",
+    "done": "✅ Done",
+    "failed": "❌ Failed",
+}
+
+
+def _result_row(document, status, result=None):
+    """One row of the batch progress table"""
+    row = {
+        "File": document.filename,
+        "Status": STATUS_LABELS[status],
+        "Type": "",
+        "Vendor": "",
+        "Total": "",
+        "Error": "",
+    }
+    if isinstance(result, dict):
+        row["Status"] = STATUS_LABELS["failed"]
+        row["Error"] = result.get("error", "Unknown error")
+    elif result is not None:
+        row["Type"] = result.document_type.capitalize()
+        row["Vendor"] = result.vendor_name
+        row["Total"] = f"${result.total_amount}"
+    return row
+
+
+def _save_batch(documents, results):
+    """Save every successful result in one bulk insert"""
+    if not postgres.is_connected():
+        st.error(
+            "⚠️ Database connection not configured. Please set POSTGRES_CONNECTION_STRING environment variable with your PostgreSQL connection string."
+        )
+        return
+
+    to_save = [
+        (result.model_dump(), document.filename, document.file_hash)
+        for document, result in zip(documents, results)
+        if not isinstance(result, dict)
+    ]
+    with st.spinner(f"Saving {len(to_save)} documents to database..."):
+        result = postgres.save_invoices_bulk(to_save)
+
+    if not result["success"]:
+        st.error(f"❌ Failed to save to database: {result.get('error', 'Unknown error')}")
+        return
+
+    duplicates = len(result["duplicates"])
+    st.success(f"✅ Saved {len(to_save) - duplicates} documents to the database")
+    if duplicates:
+        action = "merged into" if settings.POSTGRES_DUPLICATE_POLICY == "merge" else "already in"
+        st.info(f"ℹ️ {duplicates} documents were {action} the database")
+
+
+def display_batch_extraction():
+    """Batch mode: extract many files (or ZIP archives) in parallel"""
+    allowed_types = [f".{ext}" for types in ALLOWED_FILE_TYPES.values() for ext in types]
+    uploaded_files = st.file_uploader(
+        "Choose files",
+        type=allowed_types + [".zip"],
+        accept_multiple_files=True,
+        help=f"Upload up to {settings.BATCH_MAX_FILES} PDF or image files, or ZIP archives of them",
+        key="batch_file_uploader",
+    )
+    if not uploaded_files:
+        return
+
+    documents, skipped = expand_uploads([(file.name, file.getvalue()) for file in uploaded_files])
+    if skipped:
+        with st.expander(f"⚠️ {len(skipped)} files skipped"):
+            for reason in skipped:
+                st.write(f"- {reason}")
+    if not documents:
+        st.error("❌ No supported files found in the upload")
+        return
+
+    # Results are kept per set of files and model, so reruns don't re-extract
+    current_model = st.session_state.get("selected_model", settings.OPENROUTER_MODEL)
+    batch_id = hashlib.sha256(
+        "".join(document.file_hash for document in documents).encode("utf-8")
+    ).hexdigest()[:16]
+    batch_key = f"batch_{batch_id}_{current_model}"
+
+    if batch_key not in st.session_state:
+        st.write(f"**{len(documents)} documents** ready to extract with {current_model}")
+        if not st.button("Extract all", key="batch_extract_button", type="primary"):
+            return
+
+        rows = [_result_row(document, "queued") for document in documents]
+        progress = st.progress(0.0, text=f"Extracting 0 of {len(documents)} documents...")
+        table = st.empty()
+        table.dataframe(rows, use_container_width=True)
+        finished = 0
+
+        def show_update(index, status, result):
+            nonlocal finished
+            rows[index] = _result_row(documents[index], status, result)
+            if status == "done":
+                finished += 1
+                progress.progress(
+                    finished / len(documents),
+                    text=f"Extracting {finished} of {len(documents)} documents...",
+                )
+            table.dataframe(rows, use_container_width=True)
+
+        results = extract_batch(documents, model=current_model, on_update=show_update)
+        st.session_state[batch_key] = results
+        progress.empty()
+        table.empty()
+
+    results = st.session_state[batch_key]
+    succeeded = sum(1 for result in results if not isinstance(result, dict))
+    st.subheader(f"📦 Batch results: {succeeded} of {len(results)} extracted")
+    st.dataframe(
+        [_result_row(document, "done", result) for document, result in zip(documents, results)],
+        use_container_width=True,
+    )
+
+    if succeeded:
+        if st.button(
+            f"Save {succeeded} documents to Database",
+            key="batch_save_button",
+            use_container_width=True,
+        ):
+            _save_batch(documents, results)
@@ -1,10 +1,140 @@
-import json
+from decimal import Decimal
 
 import streamlit as st
 
 from app.core.supabase_client import postgres
 from app.streamlit_func.display_line_items import display_line_items
 
+# Documents per history page
+HISTORY_PAGE_SIZE = 10
+
+
+def _format_uploaded(uploaded_at):
+    # Handle datetime objects from psycopg2
+    if hasattr(uploaded_at, "strftime"):
+        return uploaded_at.strftime("%Y-%m-%d")
+    if isinstance(uploaded_at, str) and "T" in uploaded_at:
+        return uploaded_at.split("T")[0]
+    return uploaded_at or "N/A"
+
+
+def _search_filters():
+    """Search inputs for the history tables; returns the filters that are set"""
+    with st.expander("🔍 Search documents"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            vendor = st.text_input("Vendor", key="history_vendor")
+            date_from = st.date_input("Date from", value=None, key="history_date_from")
+            min_amount = st.number_input("Min amount", value=None, min_value=0.0, key="history_min_amount")
+        with col2:
+            customer = st.text_input("Customer", key="history_customer")
+            date_to = st.date_input("Date to", value=None, key="history_date_to")
+            max_amount = st.number_input("Max amount", value=None, min_value=0.0, key="history_max_amount")
+        with col3:
+            number = st.text_input("Invoice / PO / reference number", key="history_number")
+            text = st.text_input("Line item description", key="history_text")
+
+    filters = {
+        "vendor": vendor.strip(),
+        "customer": customer.strip(),
+        "number": number.strip(),
+        "date_from": date_from,
+        "date_to": date_to,
+        "min_amount": Decimal(str(min_amount)) if min_amount is not None else None,
+        "max_amount": Decimal(str(max_amount)) if max_amount is not None else None,
+        "text": text.strip(),
+    }
+    return {name: value for name, value in filters.items() if value not in (None, "")}
+
+
+def _history_page(table, filters):
+    """Fetch the current page of a history table
+
+    The keyset cursor of every page visited so far is kept in session state,
+    so "Newer" can step back without offsets. Changing the filters starts
+    again from the first page.
+    """
+    if st.session_state.get(f"{table}_history_filters") != filters:
+        st.session_state[f"{table}_history_filters"] = filters
+        st.session_state[f"{table}_history_cursors"] = [None]
+    cursors = st.session_state.setdefault(f"{table}_history_cursors", [None])
+    result = postgres.search_documents(table, limit=HISTORY_PAGE_SIZE, after=cursors[-1], **filters)
+    return result, cursors
+
+
+def _display_pagination(table, cursors, next_cursor):
+    """Newer/Older buttons for a history table"""
+    if len(cursors) == 1 and next_cursor is None:
+        return
+    newer_col, page_col, older_col = st.columns([1, 2, 1])
+    with newer_col:
+        st.button(
+            "← Newer",
+            key=f"{table}_newer",
+            disabled=len(cursors) == 1,
+            on_click=cursors.pop,
+            use_container_width=True,
+        )
+    with page_col:
+        st.caption(f"Page {len(cursors)}")
+    with older_col:
+        st.button(
+            "Older →",
+            key=f"{table}_older",
+            disabled=next_cursor is None,
+            on_click=cursors.append,
+            args=(next_cursor,),
+            use_container_width=True,
+        )
+
+
+def _display_document_line_items(table, document_id):
+    """Load and show the line items of one document (only when it is selected)"""
+    result = postgres.get_document_line_items(table, document_id)
+    if not result["success"]:
+        st.error(f"Failed to load line items: {result.get('error')}")
+        return
+
+    line_items = result["line_items"]
+    if line_items:
+        st.markdown(
+            '<div class="section-divider"></div>',
+            unsafe_allow_html=True,
+        )
+        st.markdown(
+            '<div class="section-header no-border"><h3>Line Items</h3></div>',
+            unsafe_allow_html=True,
+        )
+        display_line_items(line_items)
+
+
+def _display_document_details(title, vendor, date, amount):
+    # Display document details without card wrapper
+    st.markdown(
+        f'<div class="section-header no-border"><h3>{title}</h3></div>',
+        unsafe_allow_html=True,
+    )
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.markdown("**Vendor**")
+        st.markdown(
+            f"<div class='field-value'>{vendor}</div>",
+            unsafe_allow_html=True,
+        )
+    with col2:
+        st.markdown("**Date**")
+        st.markdown(
+            f"<div class='field-value'>{date}</div>",
+            unsafe_allow_html=True,
+        )
+    with col3:
+        st.markdown("**Amount**")
+        st.markdown(
+            f"<div class='field-value'>${amount}</div>",
+            unsafe_allow_html=True,
+        )
+
 
 def display_history():
     """Display history of processed documents"""
@@ -13,21 +143,29 @@ def display_history():
         return
 
     try:
-        result = postgres.get_recent_documents(limit=5)
-
-        if not result["success"]:
-            st.error(f"Failed to fetch history: {result.get('error')}")
-            return
-
-        if not result["invoices"] and not result["statements"]:
-            st.info("No documents found in the database")
+        filters = _search_filters()
+        invoices_result, invoice_cursors = _history_page("invoices", filters)
+        statements_result, statement_cursors = _history_page("statements", filters)
+
+        for result in (invoices_result, statements_result):
+            if not result["success"]:
+                st.error(f"Failed to fetch history: {result.get('error')}")
+                return
+
+        invoices = invoices_result["documents"]
+        statements = statements_result["documents"]
+        if not invoices and not statements:
+            if filters:
+                st.info("No documents match your search")
+            else:
+                st.info("No documents found in the database")
             return
 
-        st.subheader("📚 Recent Documents")
+        st.subheader("📚 Documents")
 
         # Display invoices
-        if result["invoices"]:
-            st.write("**Recent Invoices**")
+        if invoices:
+            st.write("**Invoices**")
             invoice_data = {
                 "Invoice #": [],
                 "Vendor": [],
@@ -36,163 +174,76 @@ def display_history():
                 "Uploaded": [],
             }
 
-            for inv in result["invoices"]:
+            for inv in invoices:
                 invoice_data["Invoice #"].append(inv.get("invoice_number", "N/A"))
                 invoice_data["Vendor"].append(inv.get("vendor_name", "N/A"))
                 invoice_data["Date"].append(inv.get("invoice_date", "N/A"))
                 invoice_data["Amount"].append(f"${inv.get('total_amount', 'N/A')}")
-                uploaded_at = inv.get("uploaded_at", "N/A")
-                # Handle datetime objects from psycopg2
-                if hasattr(uploaded_at, "strftime"):
-                    uploaded_at = uploaded_at.strftime("%Y-%m-%d")
-                elif isinstance(uploaded_at, str) and "T" in uploaded_at:
-                    uploaded_at = uploaded_at.split("T")[0]
-                invoice_data["Uploaded"].append(uploaded_at)
+                invoice_data["Uploaded"].append(_format_uploaded(inv.get("uploaded_at")))
 
             st.dataframe(invoice_data, use_container_width=True)
+            _display_pagination("invoices", invoice_cursors, invoices_result["next_cursor"])
 
             # Allow viewing line items for selected invoice
-            if len(result["invoices"]) > 0:
-                invoice_options = {
-                    f"{inv.get('invoice_number', 'Unknown')} - {inv.get('vendor_name', 'Unknown')}": i
-                    for i, inv in enumerate(result["invoices"])
-                }
-
-                selected_invoice = st.selectbox(
-                    "Select an invoice to view details:",
-                    options=list(invoice_options.keys()),
-                    index=None,
-                    key="invoice_selector",
-                )
+            invoice_options = {
+                f"{inv.get('invoice_number', 'Unknown')} - {inv.get('vendor_name', 'Unknown')}": i
+                for i, inv in enumerate(invoices)
+            }
 
-                if selected_invoice:
-                    inv_index = invoice_options[selected_invoice]
-                    invoice = result["invoices"][inv_index]
-
-                    # Display invoice details without card wrapper
-                    st.markdown(
-                        '<div class="section-header no-border"><h3>Invoice Information</h3></div>',
-                        unsafe_allow_html=True,
-                    )
-
-                    # Invoice details
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        st.markdown("**Vendor**")
-                        st.markdown(
-                            f"<div class='field-value'>{invoice.get('vendor_name', 'N/A')}</div>",
-                            unsafe_allow_html=True,
-                        )
-                    with col2:
-                        st.markdown("**Date**")
-                        st.markdown(
-                            f"<div class='field-value'>{invoice.get('invoice_date', 'N/A')}</div>",
-                            unsafe_allow_html=True,
-                        )
-                    with col3:
-                        st.markdown("**Amount**")
-                        st.markdown(
-                            f"<div class='field-value'>${invoice.get('total_amount', 'N/A')}</div>",
-                            unsafe_allow_html=True,
-                        )
-
-                    # Display line items if available
-                    line_items = invoice.get("line_items", [])
-                    if line_items:
-                        st.markdown(
-                            '<div class="section-divider"></div>',
-                            unsafe_allow_html=True,
-                        )
-                        st.markdown(
-                            '<div class="section-header no-border"><h3>Line Items</h3></div>',
-                            unsafe_allow_html=True,
-                        )
-                        display_line_items(line_items)
+            selected_invoice = st.selectbox(
+                "Select an invoice to view details:",
+                options=list(invoice_options.keys()),
+                index=None,
+                key="invoice_selector",
+            )
+
+            if selected_invoice in invoice_options:
+                invoice = invoices[invoice_options[selected_invoice]]
+                _display_document_details(
+                    "Invoice Information",
+                    invoice.get("vendor_name", "N/A"),
+                    invoice.get("invoice_date", "N/A"),
+                    invoice.get("total_amount", "N/A"),
+                )
+                _display_document_line_items("invoices", invoice["id"])
 
         # Display statements
-        if result["statements"]:
+        if statements:
             st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
-            st.write("**Recent Statements**")
+            st.write("**Statements**")
             statement_data = {"Vendor": [], "Date": [], "Amount": [], "Uploaded": []}
 
-            for stmt in result["statements"]:
+            for stmt in statements:
                 statement_data["Vendor"].append(stmt.get("vendor_name", "N/A"))
                 statement_data["Date"].append(stmt.get("statement_date", "N/A"))
                 statement_data["Amount"].append(f"${stmt.get('total_amount', 'N/A')}")
-                uploaded_at = stmt.get("uploaded_at", "N/A")
-                # Handle datetime objects from psycopg2
-                if hasattr(uploaded_at, "strftime"):
-                    uploaded_at = uploaded_at.strftime("%Y-%m-%d")
-                elif isinstance(uploaded_at, str) and "T" in uploaded_at:
-                    uploaded_at = uploaded_at.split("T")[0]
-                statement_data["Uploaded"].append(uploaded_at)
+                statement_data["Uploaded"].append(_format_uploaded(stmt.get("uploaded_at")))
 
             st.dataframe(statement_data, use_container_width=True)
+            _display_pagination("statements", statement_cursors, statements_result["next_cursor"])
 
             # Allow viewing line items for selected statement
-            if len(result["statements"]) > 0:
-                statement_options = {
-                    f"{stmt.get('vendor_name', 'Unknown')} - {stmt.get('statement_date', 'Unknown')}": i
-                    for i, stmt in enumerate(result["statements"])
-                }
-
-                selected_statement = st.selectbox(
-                    "Select a statement to view details:",
-                    options=list(statement_options.keys()),
-                    index=None,
-                    key="statement_selector",
-                )
+            statement_options = {
+                f"{stmt.get('vendor_name', 'Unknown')} - {stmt.get('statement_date', 'Unknown')}": i
+                for i, stmt in enumerate(statements)
+            }
 
-                if selected_statement:
-                    stmt_index = statement_options[selected_statement]
-                    statement = result["statements"][stmt_index]
-
-                    # Display statement details without card wrapper
-                    st.markdown(
-                        '<div class="section-header no-border"><h3>Statement Information</h3></div>',
-                        unsafe_allow_html=True,
-                    )
-
-                    # Statement details
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        st.markdown("**Vendor**")
-                        st.markdown(
-                            f"<div class='field-value'>{statement.get('vendor_name', 'N/A')}</div>",
-                            unsafe_allow_html=True,
-                        )
-                    with col2:
-                        st.markdown("**Date**")
-                        st.markdown(
-                            f"<div class='field-value'>{statement.get('statement_date', 'N/A')}</div>",
-                            unsafe_allow_html=True,
-                        )
-                    with col3:
-                        st.markdown("**Amount**")
-                        st.markdown(
-                            f"<div class='field-value'>${statement.get('total_amount', 'N/A')}</div>",
-                            unsafe_allow_html=True,
-                        )
-
-                    # Display line items if available
-                    line_items = statement.get("line_items", [])
-                    if line_items:
-                        # Handle JSON string or Python object
-                        if isinstance(line_items, str):
-                            try:
-                                line_items = json.loads(line_items)
-                            except json.JSONDecodeError:
-                                line_items = []
-
-                        st.markdown(
-                            '<div class="section-divider"></div>',
-                            unsafe_allow_html=True,
-                        )
-                        st.markdown(
-                            '<div class="section-header no-border"><h3>Line Items</h3></div>',
-                            unsafe_allow_html=True,
-                        )
-                        display_line_items(line_items)
+            selected_statement = st.selectbox(
+                "Select a statement to view details:",
+                options=list(statement_options.keys()),
+                index=None,
+                key="statement_selector",
+            )
+
+            if selected_statement in statement_options:
+                statement = statements[statement_options[selected_statement]]
+                _display_document_details(
+                    "Statement Information",
+                    statement.get("vendor_name", "N/A"),
+                    statement.get("statement_date", "N/A"),
+                    statement.get("total_amount", "N/A"),
+                )
+                _display_document_line_items("statements", statement["id"])
 
     except Exception as e:
         st.error(f"Error displaying history: {str(e)}")
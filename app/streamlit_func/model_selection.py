@@ -1,6 +1,9 @@
 import logging
 import streamlit as st
 
+from app.config import settings
+from app.core.router import AUTO_MODEL
+
 logger = logging.getLogger(__name__)
 
 def display_model_selection():
@@ -26,44 +29,50 @@ def display_model_selection():
     
     # Create a dictionary of model options with additional metadata
     model_options = {
+        "Auto (routed)": {
+            "id": AUTO_MODEL,
+            "description": "Picks the cheapest healthy model from live latency and error rates, and falls back to the next one when a model fails.",
+            "badge": "AUTO",
+            "icon": "🔀"
+        },
         "Mistral Small (24B)": {
-            "id": "mistralai/mistral-small-3.1-24b-instruct",
+            "id": settings.OPENROUTER_MODEL_MISTRAL,
             "description": "Mistral AI's 24B parameter model with strong reasoning capabilities.",
             "badge": "RECOMMENDED",
             "icon": "🧠"
         },
         "Google Gemma 3 (27B)": {
-            "id": "google/gemma-3-27b-it",
+            "id": settings.OPENROUTER_MODEL_GEMMA,
             "description": "Google's Gemma 3 model optimized for instruction following with 27B parameters.",
             "badge": "FAST",
             "icon": "⚡"
         },
         "Qwen 2.5 VL (32B)": {
-            "id": "qwen/qwen2.5-vl-32b-instruct:free",
+            "id": settings.OPENROUTER_MODEL_QWEN,
             "description": "Qwen's 32B vision-language model with excellent text and image comprehension abilities.",
             "badge": "OPTIMAL",
             "icon": "👁️"
         },
         "GPT-4o Mini": {
-            "id": "openai/gpt-4o-mini",
+            "id": settings.OPENROUTER_MODEL_GPT,
             "description": "OpenAI's smaller version of GPT-4o with excellent reasoning and instruction following.",
             "badge": "BALANCED",
             "icon": "🤖"
         },
         "Llama 4 Maverick": {
-            "id": "meta-llama/llama-4-maverick",
+            "id": settings.OPENROUTER_MODEL_LLAMA,
             "description": "Meta's newest Llama 4 Maverick model with strong performance on complex tasks.",
             "badge": "POWERFUL",
             "icon": "🦙"
         },
         "Gemini 2.0 Flash": {
-            "id": "google/gemini-2.0-flash-001",
+            "id": settings.OPENROUTER_MODEL_GEMINI,
             "description": "Google's Gemini 2.0 Flash model optimized for speed and efficiency.",
             "badge": "SPEEDY",
             "icon": "🌟"
         },
         "Amazon Nova Lite": {
-            "id": "amazon/nova-lite-v1",
+            "id": settings.OPENROUTER_MODEL_AMAZON,
             "description": "Amazon's Nova Lite model with excellent document understanding capabilities.",
             "badge": "NEW",
             "icon": "📊"
@@ -74,7 +83,7 @@ def display_model_selection():
     selected_model_name = st.selectbox(
         "Select AI Model",
         options=list(model_options.keys()),
-        index=2,  # Default to Qwen 2.5 VL (32B) which is the third option (index 2)
+        index=3,  # Default to Qwen 2.5 VL (32B) which is the fourth option (index 3)
         help="Choose which AI model to use for data extraction"
     )
     
@@ -1,10 +1,13 @@
 import streamlit as st
+from app.config import settings
 from app.core.supabase_client import postgres
+from app.core.templates import template_store
 import logging
 
 logger = logging.getLogger(__name__)
 
-def display_rating_component(filename, document_type, model=None, show_in_history=False, document_id=None):
+def display_rating_component(filename, document_type, model=None, show_in_history=False, document_id=None,
+                             file_bytes=None, extracted_data=None):
     """
     Display a rating component for users to rate the extraction quality
     
@@ -14,6 +17,8 @@ def display_rating_component(filename, document_type, model=None, show_in_histor
         model: The AI model used for extraction
         show_in_history: Whether this is shown in the history tab
         document_id: The database ID of the document (used in history view)
+        file_bytes: The original file, used to learn a vendor template from good ratings
+        extracted_data: The extracted fields the rating applies to
     """
     # Create a unique key suffix based on context
     key_suffix = f"history_{document_id}" if show_in_history else "extract"
@@ -103,6 +108,15 @@ def display_rating_component(filename, document_type, model=None, show_in_histor
             
             if result["success"]:
                 st.success("Thank you for your feedback!")
+
+                # Well-rated extractions teach the vendor's layout for next time
+                if (
+                    settings.TEMPLATE_ENABLED
+                    and rating >= settings.TEMPLATE_MIN_RATING
+                    and file_bytes
+                    and extracted_data
+                ):
+                    template_store.learn(file_bytes, extracted_data)
                 
                 # Clear the form after submission
                 if f"rating_{key_suffix}" in st.session_state:
@@ -3,7 +3,7 @@ import streamlit as st
 from app.core.supabase_client import postgres
 
 
-def save_to_database(invoice_data, filename):
+def save_to_database(invoice_data, filename, file_hash=None):
     """Save extracted data to PostgreSQL database"""
     if not postgres.is_connected():
         st.error(
@@ -11,7 +11,18 @@ def save_to_database(invoice_data, filename):
         )
         return False
 
-    result = postgres.save_invoice(invoice_data, filename)
+    result = postgres.save_invoice(invoice_data, filename, file_hash=file_hash)
+
+    if result.get("duplicate"):
+        if result["success"]:
+            st.info(
+                f"ℹ️ This document was already saved; merged into {result['table']} record ID: {result['record_id']}"
+            )
+            return True
+        st.warning(
+            f"⚠️ This document is already saved in the {result['table']} table with ID: {result['record_id']}"
+        )
+        return False
 
     if result["success"]:
         st.success(
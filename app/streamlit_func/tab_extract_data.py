@@ -3,8 +3,11 @@ import logging
 
 import streamlit as st
 
-from app.core.convert_to_image import process_file_to_images
-from app.core.llm import extract_info, parse_and_validate_llm_output
+from app.core.convert_to_image import ALLOWED_FILE_TYPES, get_file_type, process_file_to_images
+from app.config import settings
+from app.core.cache import hash_file_bytes
+from app.core.pipeline import extract_document
+from app.streamlit_func.batch_extraction import display_batch_extraction
 from app.streamlit_func.display_line_items import display_line_items
 from app.streamlit_func.save_to_database import save_to_database
 from app.streamlit_func.rating_component import display_rating_component
@@ -12,12 +15,6 @@ from app.streamlit_func.rating_component import display_rating_component
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Allowed file types
-ALLOWED_FILE_TYPES = {
-    "pdf": ["pdf"],
-    "image": ["png", "jpg", "jpeg", "webp"]
-}
-
 def display_extract_data_tab():
     """Display the Extract Data tab content"""
     # Add title and description
@@ -33,6 +30,14 @@ def display_extract_data_tab():
         unsafe_allow_html=True,
     )
 
+    if st.toggle(
+        "Batch mode",
+        key="batch_mode",
+        help="Upload many files or ZIP archives and extract them in parallel",
+    ):
+        display_batch_extraction()
+        return
+
     # Create columns for better layout
     col1, col2 = st.columns([2, 1])
 
@@ -100,15 +105,10 @@ def display_extract_data_tab():
                     logger.info(f"Reprocessing file: {filename}")
 
                 # Process file (PDF or image)
-                file_extension = filename.split('.')[-1].lower()
-                file_type = next(
-                    (ftype for ftype, extensions in ALLOWED_FILE_TYPES.items() 
-                     if file_extension in extensions),
-                    None
-                )
+                file_type = get_file_type(filename)
                 
                 if not file_type:
-                    st.error(f"❌ Unsupported file type: {file_extension}")
+                    st.error(f"❌ Unsupported file type: {filename.split('.')[-1].lower()}")
                     return
                 
                 status.update(
@@ -127,38 +127,51 @@ def display_extract_data_tab():
                     # Get current model
                     current_model = st.session_state.get("selected_model", "Unknown")
                     
-                    # Create a model-specific key for caching
-                    file_model_key = f"extracted_{filename}_{current_model}"
+                    # Create a content- and model-specific key for caching so two
+                    # different files with the same name never collide
+                    file_model_key = f"extracted_{hash_file_bytes(pdf_bytes)}_{current_model}"
                     
                     # Check if we have results for this file with the current model
                     if file_model_key not in st.session_state:
-                        # Extract information using LLM
-                        status.update(
-                            label=f"Extracting data with {current_model}...",
-                            state="running",
-                            expanded=True,
-                        )
-                        extracted_info = extract_info(images[0])
-                        logger.info("Extracted info: %s", str(extracted_info))
+                        # Show fields as they stream in from the model
+                        live_preview = st.empty()
+                        live_fields = {}
+                        live_line_items = []
+
+                        def show_stream_event(event):
+                            if event["type"] == "line_item":
+                                live_line_items.append(event["item"])
+                            elif event["name"] != "line_items" and event["value"] not in (None, ""):
+                                live_fields.setdefault(event["name"], event["value"])
+                            lines = [f"- **{name}**: {value}" for name, value in live_fields.items()]
+                            if live_line_items:
+                                lines.append(f"- **line items received**: {len(live_line_items)}")
+                            live_preview.markdown("\n".join(lines))
 
-                        # Parse and validate LLM output
-                        status.update(
-                            label="Validating extracted data...",
-                            state="running",
-                            expanded=True,
+                        # Extract information from every page (or load it from the
+                        # persistent extraction cache) and validate it
+                        parsed_data = extract_document(
+                            pdf_bytes,
+                            file_type,
+                            images=images,
+                            on_status=lambda label: status.update(
+                                label=label, state="running", expanded=True
+                            ),
+                            on_event=show_stream_event if settings.STREAMING_ENABLED else None,
                         )
-                        parsed_data = parse_and_validate_llm_output(extracted_info)
+                        live_preview.empty()
+                        logger.info("Extracted info: %s", str(parsed_data))
                         
                         # Store in session state with model-specific key
                         st.session_state[file_model_key] = parsed_data
                         
                         # Store the file information in session state for reuse
-                        st.session_state["last_uploaded_filename"] = uploaded_file.name
+                        st.session_state["last_uploaded_filename"] = filename
                         st.session_state["last_uploaded_file_bytes"] = pdf_bytes
                     else:
                         # Use cached results from session state for this model
                         parsed_data = st.session_state[file_model_key]
-                        logger.info(f"Using cached extraction results for {uploaded_file.name} with model {current_model}")
+                        logger.info(f"Using cached extraction results for {filename} with model {current_model}")
 
                     # Complete the status
                     status.update(
@@ -318,8 +331,10 @@ def display_extract_data_tab():
                         # Rating component section - show after successful extraction
                         st.markdown("<div class='section-divider'></div>", unsafe_allow_html=True)
                         display_rating_component(
-                            filename=uploaded_file.name,
-                            document_type=parsed_dict.get("document_type", "invoice")
+                            filename=filename,
+                            document_type=parsed_dict.get("document_type", "invoice"),
+                            file_bytes=pdf_bytes,
+                            extracted_data=parsed_dict,
                         )
                         
                         # Save to Database section
@@ -338,7 +353,9 @@ def display_extract_data_tab():
                         with save_col2:
                             if save_clicked:
                                 with st.spinner("Saving to database..."):
-                                    save_result = save_to_database(parsed_dict, uploaded_file.name)
+                                    save_result = save_to_database(
+                                        parsed_dict, filename, file_hash=hash_file_bytes(pdf_bytes)
+                                    )
                                     if save_result:
                                         st.success("Document saved successfully!")
                             else: